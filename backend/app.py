@@ -2,17 +2,22 @@
 FastAPI Backend for ANOVA & PCA Analysis
 Author: Senior Engineer
 """
+import json
 import logging
 import os
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, Iterator
 
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 from services.anova import AnovaAnalyzer
+from services.dataset_store import DatasetNotFoundError, DatasetStore
 from services.pca import PCAAnalyzer
-from utils.file_parser import parse_uploaded_file
+from utils.admission import AdmissionController, AdmissionMiddleware
+from utils.file_parser import load_shared_dataset, parse_dataset_wave
+from utils.shared_datasets import SharedDataset, prune_registry
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +35,9 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     logger.info("🚀 Starting ANOVA/PCA Analysis Backend")
+    freed = prune_registry()
+    if freed:
+        logger.info(f"🧹 Freed {freed} orphaned shared datasets")
     yield
     logger.info("🛑 Shutting down Analysis Backend")
 
@@ -40,6 +48,22 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Stored datasets for incremental re-analysis
+dataset_store = DatasetStore()
+
+# Admission control - added before CORS so rejections still carry CORS headers
+admission = AdmissionController.from_env()
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    paths={
+        "/api/analyze/anova": "anova",
+        "/api/analyze/pca": "pca",
+        "/api/datasets": "datasets",
+        "/api/datasets/{dataset_id}/append": "datasets",
+    },
+)
+
 # CORS - Configure based on environment
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:8080")
 allowed_origins = [
@@ -67,13 +91,41 @@ async def health_check() -> dict[str, str]:
     return {"status": "healthy", "service": "analysis-backend"}
 
 
-@app.post("/api/analyze/anova")
+@app.get("/api/admission")
+async def admission_status() -> dict[str, Any]:
+    """Admission control state for this worker (slots, queue, memory, counters)"""
+    return admission.snapshot()
+
+
+def _ndjson(records: Iterator[dict[str, Any]], dataset: SharedDataset) -> Iterator[str]:
+    """
+    Serialize records as NDJSON, releasing the dataset once the stream ends
+    
+    The stream always finishes with {'type': 'end'}, or {'type': 'error'}
+    if a record fails after the 200 status was sent, so clients can tell a
+    complete result from a truncated one.
+    """
+    try:
+        for record in records:
+            yield json.dumps(record) + "\n"
+        yield json.dumps({'type': 'end'}) + "\n"
+    except Exception as e:
+        logger.error(f"❌ ANOVA stream failed: {str(e)}", exc_info=True)
+        yield json.dumps({'type': 'error', 'detail': f"Analysis failed: {str(e)}"}) + "\n"
+    finally:
+        dataset.release()
+
+
+@app.post("/api/analyze/anova", response_model=None)
 async def analyze_anova(
     file: UploadFile = File(...),
     fdr_threshold: float = Form(0.05),
     design_label: str = Form("Treatment"),
     plot_option: int = Form(3),
-) -> dict[str, Any]:
+    test: str = Form("anova"),
+    stream: bool = Form(False),
+    sheet_name: str = Form(""),
+) -> dict[str, Any] | StreamingResponse:
     """
     Perform One-Way ANOVA analysis
     
@@ -82,6 +134,9 @@ async def analyze_anova(
         fdr_threshold: FDR threshold (default: 0.05)
         design_label: Design label name
         plot_option: Plotting option (0-4)
+        test: Test to run (anova/welch/kruskal)
+        stream: Stream results as NDJSON (summary, rows by significance, boxplots, end)
+        sheet_name: Excel sheet to analyze (default: first sheet)
     
     Returns:
         ANOVA results with p-values, FDR, Bonferroni, and boxplot data
@@ -89,13 +144,26 @@ async def analyze_anova(
     try:
         logger.info(f"📊 ANOVA Analysis Started - File: {file.filename}")
         
-        # Parse file
-        data, classes, var_names = await parse_uploaded_file(file)
-        logger.info(f"✅ Data parsed: {data.shape[0]} samples × {data.shape[1]} variables")
+        if stream:
+            dataset = await load_shared_dataset(file, sheet_name or 0)
+            try:
+                analyzer = AnovaAnalyzer(fdr_threshold=fdr_threshold, test=test)
+                records = analyzer.analyze_stream(
+                    dataset.data, dataset.classes, design_label, plot_option, dataset.var_names
+                )
+            except Exception:
+                dataset.release()
+                raise
+            return StreamingResponse(_ndjson(records, dataset), media_type="application/x-ndjson")
         
-        # Run ANOVA
-        analyzer = AnovaAnalyzer(fdr_threshold=fdr_threshold)
-        results = analyzer.analyze(data, classes, design_label, plot_option, var_names)
+        # Parse file (or attach to a copy another worker already parsed)
+        with await load_shared_dataset(file, sheet_name or 0) as dataset:
+            data = dataset.data
+            logger.info(f"✅ Data parsed: {data.shape[0]} samples × {data.shape[1]} variables")
+            
+            # Run ANOVA
+            analyzer = AnovaAnalyzer(fdr_threshold=fdr_threshold, test=test)
+            results = analyzer.analyze(data, dataset.classes, design_label, plot_option, dataset.var_names)
         
         logger.info(f"✅ ANOVA Complete - {len(results['significant_variables'])} significant vars")
         return results
@@ -105,12 +173,29 @@ async def analyze_anova(
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+def _parse_pc_pairs(pc_pairs: str) -> list[tuple[int, int]] | None:
+    """Parse "1-2,1-3" into [(1, 2), (1, 3)]; empty means all pairs"""
+    if not pc_pairs.strip():
+        return None
+    pairs = []
+    for item in pc_pairs.split(','):
+        pc_x, pc_y = item.split('-')
+        pairs.append((int(pc_x), int(pc_y)))
+    return pairs
+
+
 @app.post("/api/analyze/pca")
 async def analyze_pca(
     file: UploadFile = File(...),
     num_pcs: int = Form(3),
     scaling_method: str = Form("auto"),
     design_label: str = Form("Treatment"),
+    aggregate: bool = Form(False),
+    max_points: int = Form(5000),
+    density_bins: int = Form(50),
+    top_loadings: int = Form(50),
+    pc_pairs: str = Form(""),
+    sheet_name: str = Form(""),
 ) -> dict[str, Any]:
     """
     Perform PCA analysis
@@ -120,6 +205,12 @@ async def analyze_pca(
         num_pcs: Number of principal components
         scaling_method: Scaling method (auto/mean/pareto)
         design_label: Design label name
+        aggregate: Return per-group score densities and a stratified point sample
+        max_points: Maximum score points returned in aggregate mode
+        density_bins: Bins per axis for score densities
+        top_loadings: Variables kept per component in aggregate mode
+        pc_pairs: PC pairs for densities, e.g. "1-2,1-3" (default: all pairs)
+        sheet_name: Excel sheet to analyze (default: first sheet)
     
     Returns:
         PCA results with scores, loadings, and explained variance
@@ -127,13 +218,22 @@ async def analyze_pca(
     try:
         logger.info(f"🔬 PCA Analysis Started - File: {file.filename}")
         
-        # Parse file
-        data, classes, var_names = await parse_uploaded_file(file)
-        logger.info(f"✅ Data parsed: {data.shape[0]} samples × {data.shape[1]} variables")
-        
-        # Run PCA
-        analyzer = PCAAnalyzer(n_components=num_pcs, scaling=scaling_method)
-        results = analyzer.analyze(data, classes, design_label, var_names)
+        # Parse file (or attach to a copy another worker already parsed)
+        with await load_shared_dataset(file, sheet_name or 0) as dataset:
+            data = dataset.data
+            logger.info(f"✅ Data parsed: {data.shape[0]} samples × {data.shape[1]} variables")
+            
+            # Run PCA
+            analyzer = PCAAnalyzer(
+                n_components=num_pcs,
+                scaling=scaling_method,
+                aggregate=aggregate,
+                max_points=max_points,
+                density_bins=density_bins,
+                top_loadings=top_loadings,
+                pc_pairs=_parse_pc_pairs(pc_pairs)
+            )
+            results = analyzer.analyze(data, dataset.classes, design_label, dataset.var_names)
         
         logger.info(f"✅ PCA Complete - {num_pcs} components computed")
         return results
@@ -143,6 +243,111 @@ async def analyze_pca(
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+def _store_error(action: str, e: Exception) -> HTTPException:
+    """Map dataset store failures to HTTP errors"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, DatasetNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    logger.error(f"❌ {action} Failed: {str(e)}", exc_info=True)
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=400, detail=str(e))
+    return HTTPException(status_code=500, detail=f"{action} failed: {str(e)}")
+
+
+@app.post("/api/datasets")
+async def create_dataset(
+    file: UploadFile = File(...),
+    sheet_name: str = Form(""),
+) -> dict[str, Any]:
+    """
+    Store a dataset as sufficient statistics for incremental re-analysis
+    
+    Args:
+        file: CSV/Excel file with the first wave of samples
+        sheet_name: Excel sheet to read (default: first sheet)
+    
+    Returns:
+        Dataset info including dataset_id
+    """
+    try:
+        data, labels, var_names, class_column = await parse_dataset_wave(file, sheet_name or 0)
+        return dataset_store.create(data, labels, var_names, class_column)
+    except Exception as e:
+        raise _store_error("Dataset creation", e)
+
+
+@app.post("/api/datasets/{dataset_id}/append")
+async def append_dataset(
+    dataset_id: str,
+    file: UploadFile = File(...),
+    sheet_name: str = Form(""),
+) -> dict[str, Any]:
+    """
+    Append a new wave of samples to a stored dataset
+    
+    Only the new rows are processed; stored statistics are updated in place.
+    The file must have the same variables and class column as the stored
+    dataset; a wave may hold any subset of groups, including new ones, and
+    as few as one sample.
+    """
+    try:
+        class_column = dataset_store.class_column(dataset_id)
+        data, labels, var_names, _ = await parse_dataset_wave(file, sheet_name or 0, class_column, min_samples=1)
+        return dataset_store.append(dataset_id, data, labels, var_names)
+    except Exception as e:
+        raise _store_error("Dataset append", e)
+
+
+@app.get("/api/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str) -> dict[str, Any]:
+    """Stored dataset info (size, groups, waves)"""
+    try:
+        return dataset_store.info(dataset_id)
+    except Exception as e:
+        raise _store_error("Dataset lookup", e)
+
+
+@app.post("/api/datasets/{dataset_id}/anova")
+async def analyze_dataset_anova(
+    dataset_id: str,
+    fdr_threshold: float = Form(0.05),
+    plot_option: int = Form(3),
+    test: str = Form("anova"),
+) -> dict[str, Any]:
+    """
+    ANOVA (classical or Welch) on a stored dataset from its group statistics
+    
+    Returns:
+        Same schema as /api/analyze/anova (boxplot_data is empty)
+    """
+    try:
+        analyzer = AnovaAnalyzer(fdr_threshold=fdr_threshold, test=test)
+        return dataset_store.anova(dataset_id, analyzer, plot_option)
+    except Exception as e:
+        raise _store_error("ANOVA", e)
+
+
+@app.post("/api/datasets/{dataset_id}/pca")
+async def analyze_dataset_pca(
+    dataset_id: str,
+    num_pcs: int = Form(3),
+    scaling_method: str = Form("auto"),
+    design_label: str = Form("Treatment"),
+) -> dict[str, Any]:
+    """
+    PCA on a stored dataset from its covariance statistics
+    
+    Returns:
+        Same schema as /api/analyze/pca without per-sample scores
+    """
+    try:
+        analyzer = PCAAnalyzer(n_components=num_pcs, scaling=scaling_method)
+        return dataset_store.pca(dataset_id, analyzer, design_label)
+    except Exception as e:
+        raise _store_error("PCA", e)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
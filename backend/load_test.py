@@ -0,0 +1,373 @@
+"""
+HTTP load-testing harness for the analysis endpoints
+Starts the FastAPI app locally (or targets --url) and replays synthetic uploads
+
+Run: python load_test.py --rate 5 --duration 30 --concurrency 16 \
+         --mix "anova/csv/200x500:3,pca/xlsx/100x200:1"
+
+Mix entries are endpoint/format/samplesxvariables:weight. Requests are
+issued open-loop at --rate per second; latency is measured from each
+request's scheduled start, so client-side queueing is not hidden.
+Results (latency percentiles, throughput, errors, worker RSS over time)
+are saved as JSON; pass --compare with an earlier file to print deltas.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {'anova': '/api/analyze/anova', 'pca': '/api/analyze/pca'}
+
+
+def parse_mix(mix: str) -> list[dict]:
+    """Parse "anova/csv/200x500:3,pca/xlsx/100x200:1" into scenario dicts"""
+    scenarios = []
+    for item in mix.split(','):
+        spec, _, weight = item.strip().partition(':')
+        endpoint, fmt, shape = spec.split('/')
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+        if fmt not in ('csv', 'xlsx'):
+            raise ValueError(f"Unknown format: {fmt}")
+        n_samples, n_vars = (int(x) for x in shape.lower().split('x'))
+        scenarios.append({
+            'name': spec,
+            'endpoint': endpoint,
+            'format': fmt,
+            'n_samples': n_samples,
+            'n_vars': n_vars,
+            'weight': float(weight or 1)
+        })
+    return scenarios
+
+
+def make_upload(scenario: dict, seed: int, n_groups: int = 3) -> bytes:
+    """Synthetic dataset with a Group column and a few shifted variables"""
+    rng = np.random.default_rng(seed)
+    n_samples, n_vars = scenario['n_samples'], scenario['n_vars']
+    groups = np.arange(n_samples) % n_groups + 1
+    data = rng.normal(size=(n_samples, n_vars))
+    data[:, : max(1, n_vars // 10)] += groups[:, None] * 0.5
+
+    df = pd.DataFrame(data, columns=[f'Var_{i+1}' for i in range(n_vars)])
+    df.insert(0, 'Group', groups)
+
+    if scenario['format'] == 'csv':
+        return df.to_csv(index=False).encode()
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def encode_multipart(filename: str, contents: bytes, fields: dict[str, str]) -> tuple[bytes, str]:
+    """Encode a multipart/form-data body; returns (body, content_type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+    )
+    parts.append(contents)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """Start uvicorn in a subprocess and wait for /health"""
+    cmd = [
+        sys.executable, '-m', 'uvicorn', 'app:app',
+        '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning'
+    ]
+    proc = subprocess.Popen(cmd, cwd=Path(__file__).parent)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+            logger.info(f"🚀 Server ready on port {port} (pid {proc.pid}, {workers} workers)")
+            return proc
+        except OSError:
+            time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid: int) -> list[int]:
+    """pid plus all descendants (Linux /proc)"""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class RssSampler(threading.Thread):
+    """Samples RSS of the server process tree at a fixed interval"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: list[dict] = []
+        self._stop_event = threading.Event()
+        self._t0 = time.perf_counter()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            per_process = {pid: round(_rss_mb(pid), 1) for pid in _process_tree(self.pid)}
+            self.samples.append({
+                't': round(time.perf_counter() - self._t0, 2),
+                'total_mb': round(sum(per_process.values()), 1),
+                'per_process_mb': per_process
+            })
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def send_request(url: str, body: bytes, headers: dict[str, str], timeout: float) -> tuple[int | None, str | None]:
+    """POST one upload; returns (status, error)"""
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status, None
+    except urllib.error.HTTPError as e:
+        return e.code, f'HTTP {e.code}'
+    except Exception as e:
+        return None, type(e).__name__
+
+
+def run_load(
+    base_url: str,
+    scenarios: list[dict],
+    rate: float,
+    duration: float,
+    concurrency: int,
+    variants: int,
+    timeout: float,
+    seed: int
+) -> tuple[list[dict], float]:
+    """Issue requests open-loop at `rate`/s for `duration` seconds; returns (records, wall_time)"""
+    logger.info("📦 Generating synthetic uploads...")
+    payloads = {}
+    for scenario in scenarios:
+        ext = scenario['format']
+        payloads[scenario['name']] = [
+            encode_multipart(f'load_{i}.{ext}', make_upload(scenario, seed + i), {'design_label': 'Group'})
+            for i in range(variants)
+        ]
+
+    rng = random.Random(seed)
+    weights = [s['weight'] for s in scenarios]
+    records: list[dict] = []
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    def task(scenario: dict, scheduled: float) -> None:
+        body, content_type = rng.choice(payloads[scenario['name']])
+        headers = {
+            'Content-Type': content_type,
+            # Declared shape lets admission control estimate memory cost
+            'X-Dataset-Shape': f"{scenario['n_samples']}x{scenario['n_vars'] + 1}"
+        }
+        started = time.perf_counter()
+        status, error = send_request(base_url + ENDPOINTS[scenario['endpoint']], body, headers, timeout)
+        finished = time.perf_counter()
+        with lock:
+            records.append({
+                'scenario': scenario['name'],
+                't': round(scheduled - t0, 3),
+                'latency': finished - scheduled,
+                'queue_delay': started - scheduled,
+                'status': status,
+                'error': error
+            })
+
+    n_requests = int(rate * duration)
+    logger.info(f"🔥 Sending {n_requests} requests at {rate}/s with {concurrency} clients")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(n_requests):
+            scheduled = t0 + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(task, rng.choices(scenarios, weights)[0], scheduled)
+
+    return records, time.perf_counter() - t0
+
+
+def summarize(records: list[dict], wall_time: float) -> dict:
+    """Latency percentiles, throughput and error rate"""
+    if not records:
+        return {'requests': 0}
+    latencies = np.array([r['latency'] for r in records]) * 1000
+    ok = sum(1 for r in records if r['error'] is None)
+    status_counts: dict[str, int] = {}
+    for r in records:
+        key = str(r['status']) if r['status'] is not None else r['error']
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    return {
+        'requests': len(records),
+        'throughput_rps': round(ok / wall_time, 2),
+        'error_rate': round(1 - ok / len(records), 4),
+        'latency_ms': {
+            'p50': round(float(np.percentile(latencies, 50)), 1),
+            'p95': round(float(np.percentile(latencies, 95)), 1),
+            'p99': round(float(np.percentile(latencies, 99)), 1),
+            'max': round(float(latencies.max()), 1)
+        },
+        'status_counts': status_counts
+    }
+
+
+def compare(current: dict, previous: dict) -> None:
+    """Log p50/p95/p99, throughput and error-rate deltas against a previous run"""
+    logger.info("=" * 60)
+    logger.info(f"📈 Comparison with {previous['config'].get('label') or previous['timestamp']}")
+    for name, stats_now in current['scenarios'].items():
+        stats_before = previous['scenarios'].get(name)
+        if not stats_before or not stats_before.get('requests'):
+            logger.info(f"{name}: no baseline")
+            continue
+        parts = []
+        for pct in ('p50', 'p95', 'p99'):
+            now, before = stats_now['latency_ms'][pct], stats_before['latency_ms'][pct]
+            change = (now - before) / before * 100 if before else 0.0
+            parts.append(f"{pct} {before:.0f}→{now:.0f}ms ({change:+.1f}%)")
+        parts.append(f"rps {stats_before['throughput_rps']}→{stats_now['throughput_rps']}")
+        parts.append(f"err {stats_before['error_rate']:.2%}→{stats_now['error_rate']:.2%}")
+        logger.info(f"{name}: " + ', '.join(parts))
+
+
+def main():
+    """Run the load test and save results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Target an already running backend instead of starting one")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers when starting the app")
+    parser.add_argument('--mix', default='anova/csv/200x500:3,pca/csv/200x500:1')
+    parser.add_argument('--rate', type=float, default=5.0, help="Requests per second")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections")
+    parser.add_argument('--variants', type=int, default=4, help="Distinct uploads per scenario")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout (s)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='', help="Release/run label stored with the results")
+    parser.add_argument('--output-dir', default='load_test_results')
+    parser.add_argument('--compare', help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    scenarios = parse_mix(args.mix)
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        port = _free_port()
+        server = start_server(port, args.workers)
+        base_url = f'http://127.0.0.1:{port}'
+
+    sampler = RssSampler(server.pid) if server else None
+    try:
+        if sampler:
+            sampler.start()
+        records, wall_time = run_load(
+            base_url, scenarios, args.rate, args.duration,
+            args.concurrency, args.variants, args.timeout, args.seed
+        )
+    finally:
+        if sampler:
+            sampler.stop()
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output_dir', 'compare')},
+        'overall': summarize(records, wall_time),
+        'scenarios': {
+            s['name']: summarize([r for r in records if r['scenario'] == s['name']], wall_time)
+            for s in scenarios
+        },
+        'rss': sampler.samples if sampler else [],
+        'requests': records
+    }
+    if sampler and sampler.samples:
+        results['overall']['peak_rss_mb'] = max(s['total_mb'] for s in sampler.samples)
+
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"load_{args.label or 'run'}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    out_path.write_text(json.dumps(results, indent=2))
+
+    logger.info("=" * 60)
+    for name, stats in [('overall', results['overall']), *results['scenarios'].items()]:
+        if not stats.get('requests'):
+            continue
+        lat = stats['latency_ms']
+        logger.info(
+            f"{name}: {stats['requests']} req, {stats['throughput_rps']} rps, "
+            f"p50 {lat['p50']}ms p95 {lat['p95']}ms p99 {lat['p99']}ms, "
+            f"errors {stats['error_rate']:.2%}"
+        )
+    if 'peak_rss_mb' in results['overall']:
+        logger.info(f"Peak server RSS: {results['overall']['peak_rss_mb']} MB")
+    logger.info(f"💾 Results saved to {out_path}")
+
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
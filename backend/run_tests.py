@@ -3,15 +3,26 @@ Simple test script to verify backend functionality
 Run: python run_tests.py
 """
 import asyncio
+import json
 import logging
+import subprocess
+import tempfile
+from io import BytesIO
 from pathlib import Path
+from unittest import mock
 
 import numpy as np
 import pandas as pd
+from fastapi import HTTPException, UploadFile
 
 from services.anova import AnovaAnalyzer
+from services.dataset_store import DatasetStore
 from services.pca import PCAAnalyzer
+from utils.admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+from utils import excel_reader, shared_datasets
+from utils.file_parser import _parse_contents, load_shared_dataset, parse_dataset_wave
 from utils.preprocessing import scale_data
+from utils.shared_datasets import attach_dataset, dataset_key, publish_dataset
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,6 +50,20 @@ def test_anova():
     assert 'pValue' in results['results'][0], "Should have p-values"
     assert results['summary']['total_variables'] == 5
     
+    # Welch and Kruskal-Wallis share the results schema
+    for test in ('welch', 'kruskal'):
+        alt = AnovaAnalyzer(fdr_threshold=0.05, test=test).analyze(data, classes, "Test", plot_option=3)
+        assert alt['results'][0].keys() == results['results'][0].keys()
+        assert alt['summary']['test'] == test
+        assert alt['results'][0]['pValue'] < 0.05, f"{test} should detect the group shift"
+    
+    # Streaming mode: summary first, rows by significance, same values
+    records = list(analyzer.analyze_stream(data, classes, "Test", plot_option=3))
+    rows = [r for r in records if r['type'] == 'result']
+    assert records[0]['type'] == 'summary'
+    assert records[0]['summary'] == results['summary']
+    assert [r['pValue'] for r in rows] == sorted(r['pValue'] for r in results['results'])
+    
     logger.info(f"✅ ANOVA Test Passed: {results['summary']['benjamini_significant']} significant vars")
     return results
 
@@ -61,6 +86,25 @@ def test_pca():
     assert len(results['explainedVariance']) == 3, "Should have 3 PCs"
     assert 'pc1' in results['scores'][0], "Should have PC1 scores"
     
+    # Aggregation mode: stratified sample, per-group densities, trimmed loadings
+    analyzer = PCAAnalyzer(n_components=3, scaling='auto', aggregate=True, max_points=15, density_bins=4, top_loadings=2)
+    aggregated = analyzer.analyze(data, classes, "Test")
+    assert len(aggregated['scores']) == 15, "Should return a 15-point sample"
+    assert {s['group'] for s in aggregated['scores']} == {1, 2, 3}, "Sample should cover every group"
+    assert len(aggregated['density']) == 3, "Should have densities for all 3 PC pairs"
+    assert sum(np.sum(g['counts']) for g in aggregated['density'][0]['groups']) == 30
+    assert all(len(pc) == 2 for pc in aggregated['topLoadings'])
+    
+    # Sample never exceeds max_points, even with more groups than points
+    for groups, max_points in (
+        (np.repeat(np.arange(11), [9998] + [1] * 10), 10),
+        (np.repeat(np.arange(10), 10), 5),
+        (np.repeat(np.arange(11), [9998] + [1] * 10), 12),
+    ):
+        sample = PCAAnalyzer(aggregate=True, max_points=max_points)._stratified_sample(groups)
+        assert len(sample) == max_points, f"Sample should hold exactly {max_points} points"
+        assert len(np.unique(groups[sample])) == min(max_points, len(np.unique(groups)))
+    
     logger.info(f"✅ PCA Test Passed: {results['summary']['total_variance_explained']:.1f}% variance explained")
     return results
 
@@ -101,6 +145,190 @@ def test_file_parsing():
     logger.info(f"✅ File Parsing Test Passed: {df.shape[0]} rows × {df.shape[1]} cols")
 
 
+def test_excel_cache():
+    """Test Excel parsing through the columnar cache"""
+    logger.info("🧪 Testing Excel Cache...")
+    
+    df = pd.DataFrame(np.random.randn(9, 3), columns=['a', 'b', 'c'])
+    df.insert(0, 'Group', [1, 1, 1, 2, 2, 2, 3, 3, 3])
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame({'x': [0]}).to_excel(writer, sheet_name='Notes', index=False)
+        df.to_excel(writer, sheet_name='Data', index=False)
+    contents = buffer.getvalue()
+    
+    original_dir = excel_reader.CACHE_DIR
+    with tempfile.TemporaryDirectory() as cache_dir:
+        excel_reader.CACHE_DIR = Path(cache_dir)
+        try:
+            cold = _parse_contents(contents, 'test.xlsx', 'Data')
+            assert np.allclose(cold[0], df[['a', 'b', 'c']].values), "Should read the selected sheet"
+            if excel_reader.HAS_PARQUET:
+                cached = Path(cache_dir) / f"{dataset_key(contents, 'test.xlsx', 'Data')}.parquet"
+                assert cached.exists(), "First parse should write the Parquet cache"
+            
+            # Warm parse must come from Parquet, never from the workbook
+            with mock.patch.object(excel_reader.pd, 'read_excel', side_effect=AssertionError("Workbook re-parsed")):
+                warm = _parse_contents(contents, 'test.xlsx', 'Data') if excel_reader.HAS_PARQUET else cold
+            assert np.array_equal(cold[0], warm[0]) and cold[2] == warm[2], "Cached parse should match"
+        finally:
+            excel_reader.CACHE_DIR = original_dir
+    
+    logger.info("✅ Excel Cache Test Passed")
+
+
+def test_shared_datasets():
+    """Test cross-process dataset registry"""
+    logger.info("🧪 Testing Shared Datasets...")
+    
+    data = np.random.randn(6, 3)
+    classes = np.array([1, 1, 1, 2, 2, 2])
+    key = "run-tests-shared-dataset"
+    csv = b"Group,a,b\n1,1.0,2.0\n1,1.5,2.5\n1,1.2,2.2\n2,3.0,4.0\n2,3.5,4.5\n2,3.2,4.2\n"
+    
+    original_root = shared_datasets.REGISTRY_ROOT
+    with tempfile.TemporaryDirectory() as registry:
+        shared_datasets.REGISTRY_ROOT = Path(registry)
+        try:
+            first = publish_dataset(key, data, classes, ['a', 'b', 'c'])
+            second = attach_dataset(key)
+            assert second is not None, "Published dataset should be attachable"
+            assert np.array_equal(second.data, data), "Shared data should match"
+            assert not second.data.flags.writeable, "Shared views should be read-only"
+            assert second.var_names == ['a', 'b', 'c']
+            
+            first.release()
+            third = attach_dataset(key)
+            assert third is not None, "Dataset should survive while referenced"
+            second.release()
+            third.release()
+            assert attach_dataset(key) is None, "Dataset should be freed after last release"
+            
+            # Entries held only by dead workers are reclaimed on the next publish
+            dead = subprocess.Popen(['true'])
+            dead.wait()
+            publish_dataset(key, data, classes, ['a', 'b', 'c'])
+            (Path(registry) / key / 'refs.json').write_text(json.dumps([dead.pid]))
+            publish_dataset('run-tests-other-dataset', data, classes, ['a', 'b', 'c']).release()
+            assert not (Path(registry) / key).exists(), "Orphaned dataset should be pruned"
+            
+            # Unusable registry (e.g. /dev/shm full) falls back to a private handle
+            shared_datasets.REGISTRY_ROOT = Path(registry) / 'not-a-dir' / 'registry'
+            (Path(registry) / 'not-a-dir').touch()
+            upload = UploadFile(BytesIO(csv), filename='fallback.csv')
+            with asyncio.run(load_shared_dataset(upload)) as handle:
+                assert handle.key is None, "Should fall back to a private handle"
+                assert handle.data.shape == (6, 2)
+        finally:
+            shared_datasets.REGISTRY_ROOT = original_root
+    
+    logger.info("✅ Shared Dataset Test Passed")
+
+
+def test_admission():
+    """Test admission control limits and queueing"""
+    logger.info("🧪 Testing Admission Control...")
+    
+    async def scenario():
+        controller = AdmissionController({'anova': 1}, memory_budget=100, max_queue=1, max_wait=0.2)
+        await controller.acquire('anova', 10)
+        
+        # Second request queues and is admitted on release
+        waiting = asyncio.create_task(controller.acquire('anova', 10))
+        await asyncio.sleep(0)
+        assert controller.snapshot()['queue_length'] == 1
+        
+        # Queue full -> 429
+        try:
+            await controller.acquire('anova', 10)
+            raise AssertionError("Should reject when queue is full")
+        except AdmissionRejected as e:
+            assert e.status_code == 429 and e.retry_after >= 1
+        
+        controller.release('anova', 10)
+        await waiting
+        assert controller.snapshot()['endpoints']['anova']['active'] == 1
+        
+        # Over budget -> 413; wait timeout -> 503
+        for cost, status in ((1000, 413), (10, 503)):
+            try:
+                await controller.acquire('anova', cost)
+                raise AssertionError(f"Should reject with {status}")
+            except AdmissionRejected as e:
+                assert e.status_code == status
+    
+    asyncio.run(scenario())
+    
+    # Route templates match one path segment per parameter
+    middleware = AdmissionMiddleware(None, None, {'/api/datasets': 'datasets', '/api/datasets/{dataset_id}/append': 'datasets'})
+    assert middleware.endpoint_for('/api/datasets') == 'datasets'
+    assert middleware.endpoint_for('/api/datasets/abc123/append') == 'datasets'
+    assert middleware.endpoint_for('/api/datasets/abc123/anova') is None
+    assert middleware.endpoint_for('/api/datasets/a/b/append') is None
+    
+    logger.info("✅ Admission Control Test Passed")
+
+
+def test_dataset_store():
+    """Test incremental re-analysis matches a full recompute"""
+    logger.info("🧪 Testing Dataset Store...")
+    
+    np.random.seed(7)
+    data = np.random.randn(40, 6) * 3 + 10
+    data[np.random.rand(40, 6) < 0.05] = np.nan
+    labels = np.array(['A'] * 10 + ['B'] * 10 + ['A'] * 5 + ['B'] * 5 + ['C'] * 10, dtype=object)
+    
+    with tempfile.TemporaryDirectory() as root:
+        store = DatasetStore(root)
+        info = store.create(data[:20], labels[:20], None)
+        info = store.append(info['dataset_id'], data[20:], labels[20:], None)
+        assert info['n_samples'] == 40 and info['groups'] == ['A', 'B', 'C']
+        
+        analyzer = AnovaAnalyzer(fdr_threshold=0.05, test='welch')
+        stored = store.anova(info['dataset_id'], analyzer, plot_option=3)
+        full = analyzer.analyze(data, labels, "Test", plot_option=3)
+        assert np.allclose([r['pValue'] for r in stored['results']], [r['pValue'] for r in full['results']])
+        
+        pca = PCAAnalyzer(n_components=2, scaling='auto')
+        stored_pca = store.pca(info['dataset_id'], pca, "Test")
+        full_pca = pca.analyze(data, np.ones(40, dtype=int), "Test")
+        assert np.allclose(stored_pca['explainedVariance'], full_pca['explainedVariance'])
+        assert np.allclose(stored_pca['loadings'], full_pca['loadings'])
+        
+        # A wave holding a single new group reuses the class column recorded at creation
+        def upload(frame):
+            return UploadFile(BytesIO(frame.to_csv(index=False).encode()), filename='wave.csv')
+        
+        first = pd.DataFrame({'Group': [1] * 5 + [2] * 5, 'x': np.arange(10.0), 'y': np.arange(10.0) ** 2})
+        wave = pd.DataFrame({'Group': [3] * 6, 'x': np.arange(6.0), 'y': np.arange(6.0) + 1})
+        parsed = asyncio.run(parse_dataset_wave(upload(first)))
+        info = store.create(*parsed)
+        assert info['class_column'] == 'Group'
+        
+        parsed = asyncio.run(parse_dataset_wave(upload(wave), class_column=store.class_column(info['dataset_id'])))
+        info = store.append(info['dataset_id'], *parsed[:3])
+        assert info['n_samples'] == 16 and info['groups'] == ['1', '2', '3']
+        
+        # Appended waves may hold a single sample
+        single = pd.DataFrame({'Group': [4], 'x': [1.0], 'y': [2.0]})
+        parsed = asyncio.run(parse_dataset_wave(upload(single), class_column='Group', min_samples=1))
+        info = store.append(info['dataset_id'], *parsed[:3])
+        assert info['n_samples'] == 17 and info['groups'] == ['1', '2', '3', '4']
+        
+        # A blank label is rejected instead of splitting groups into '1.0' / 'nan'
+        blank = pd.DataFrame({'Group': [1, 2, None], 'x': [1.0, 2.0, 3.0], 'y': [4.0, 5.0, 6.0]})
+        try:
+            asyncio.run(parse_dataset_wave(upload(blank), class_column='Group'))
+            raise AssertionError("Wave with a blank label should be rejected")
+        except HTTPException as e:
+            assert e.status_code == 400
+        float_labels = pd.DataFrame({'Group': [1.0, 2.0, 2.0], 'x': [1.0, 2.0, 3.0], 'y': [4.0, 5.0, 6.0]})
+        parsed = asyncio.run(parse_dataset_wave(upload(float_labels), class_column='Group'))
+        assert list(parsed[1]) == ['1', '2', '2'], "Integral float labels should match stored groups"
+    
+    logger.info("✅ Dataset Store Test Passed")
+
+
 def main():
     """Run all tests"""
     logger.info("=" * 60)
@@ -112,6 +340,10 @@ def main():
         test_anova()
         test_pca()
         test_file_parsing()
+        test_excel_cache()
+        test_shared_datasets()
+        test_admission()
+        test_dataset_store()
         
         logger.info("=" * 60)
         logger.info("✅ All Tests Passed!")
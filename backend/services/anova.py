@@ -1,9 +1,10 @@
 """
 ANOVA Analysis Service
-Implements One-Way ANOVA with Bonferroni and Benjamini-Hochberg corrections
+Implements One-Way ANOVA (classical, Welch, Kruskal-Wallis)
+with Bonferroni and Benjamini-Hochberg corrections
 """
 import logging
-from typing import Any
+from typing import Any, Iterator
 
 import numpy as np
 from scipy import stats
@@ -15,8 +16,19 @@ logger = logging.getLogger(__name__)
 class AnovaAnalyzer:
     """One-Way ANOVA analyzer with multiple testing corrections"""
     
-    def __init__(self, fdr_threshold: float = 0.05):
+    TESTS = ('anova', 'welch', 'kruskal')
+    
+    def __init__(self, fdr_threshold: float = 0.05, test: str = 'anova'):
+        """
+        Args:
+            fdr_threshold: FDR / family-wise alpha
+            test: 'anova' (classical F-test), 'welch' (unequal variances)
+                  or 'kruskal' (Kruskal-Wallis rank test)
+        """
+        if test not in self.TESTS:
+            raise ValueError(f"Unknown test: {test}")
         self.fdr_threshold = fdr_threshold
+        self.test = test
     
     def analyze(
         self,
@@ -41,68 +53,18 @@ class AnovaAnalyzer:
         n_samples, n_vars = data.shape
         logger.info(f"Running ANOVA on {n_samples} samples × {n_vars} variables")
         
-        # Compute ANOVA for each variable
-        p_values = []
-        effect_sizes = []
-        
-        for i in range(n_vars):
-            var_data = data[:, i]
-            
-            # Remove NaNs
-            mask = ~np.isnan(var_data)
-            var_clean = var_data[mask]
-            class_clean = classes[mask]
-            
-            # Skip if insufficient data
-            if len(np.unique(class_clean)) < 2:
-                p_values.append(1.0)
-                effect_sizes.append(0.0)
-                continue
-            
-            # Group data by class
-            groups = [var_clean[class_clean == cls] for cls in np.unique(class_clean)]
-            
-            # Compute One-Way ANOVA
-            f_stat, p_val = stats.f_oneway(*groups)
-            p_values.append(p_val if not np.isnan(p_val) else 1.0)
-            
-            # Effect size (η²)
-            ss_between = sum(len(g) * (np.mean(g) - np.mean(var_clean))**2 for g in groups)
-            ss_total = np.sum((var_clean - np.mean(var_clean))**2)
-            effect = (ss_between / ss_total * 100) if ss_total > 0 else 0
-            effect_sizes.append(effect)
-        
-        p_values = np.array(p_values)
-        effect_sizes = np.array(effect_sizes)
-        
-        # Bonferroni correction
-        bonferroni_threshold = self.fdr_threshold / len(p_values)
-        bonferroni_sig = p_values <= bonferroni_threshold
-        
-        # Benjamini-Hochberg correction
-        # multipletests returns: (reject, pvals_corrected, alphacSidak, alphacBonf)
-        benjamini_sig, fdr_corrected, _, _ = multipletests(
-            p_values,
-            alpha=self.fdr_threshold,
-            method='fdr_bh'
-        )
+        p_values, effect_sizes = self._test_variables(data, classes)
+        fdr_corrected, benjamini_sig, bonferroni_sig = self._correct(p_values)
         
         # Build results table
-        results_table = []
-        for i in range(n_vars):
-            var_name = var_names[i] if var_names and i < len(var_names) else f'Variable_{i+1}'
-            results_table.append({
-                'variable': var_name,
-                'pValue': float(p_values[i]),
-                'fdr': float(fdr_corrected[i]),
-                'bonferroni': float(p_values[i] * len(p_values)),  # Adjusted p-value
-                'benjamini': bool(benjamini_sig[i]),
-                'effectSize': float(effect_sizes[i])
-            })
+        results_table = [
+            self._result_row(i, p_values, fdr_corrected, benjamini_sig, effect_sizes, var_names)
+            for i in range(n_vars)
+        ]
         
         # Get significant variables based on plot_option
         significant_vars = self._get_significant_vars(
-            results_table,
+            p_values,
             plot_option,
             benjamini_sig
         )
@@ -120,18 +82,303 @@ class AnovaAnalyzer:
             'results': results_table,
             'significant_variables': significant_vars,
             'boxplot_data': boxplot_data,
-            'summary': {
-                'total_variables': n_vars,
-                'benjamini_significant': int(np.sum(benjamini_sig)),
-                'bonferroni_significant': int(np.sum(bonferroni_sig)),
-                'nominal_significant': int(np.sum(p_values <= 0.05)),
-                'fdr_threshold': self.fdr_threshold
+            'summary': self._summary(p_values, benjamini_sig, bonferroni_sig)
+        }
+    
+    def analyze_stream(
+        self,
+        data: np.ndarray,
+        classes: np.ndarray,
+        design_label: str,
+        plot_option: int,
+        var_names: list[str] | None = None
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Perform One-Way ANOVA analysis, emitting results as a record stream
+        
+        Statistics are computed eagerly (so failures surface before any output);
+        records are then produced lazily in this order:
+        - one 'summary' record (summary + significant_variables)
+        - one 'result' record per variable, most significant first
+        - one 'boxplot' record per plotted variable
+        
+        Returns:
+            Iterator of JSON-serializable records
+        """
+        n_samples, n_vars = data.shape
+        logger.info(f"Running streaming ANOVA on {n_samples} samples × {n_vars} variables")
+        
+        p_values, effect_sizes = self._test_variables(data, classes)
+        fdr_corrected, benjamini_sig, bonferroni_sig = self._correct(p_values)
+        significant_vars = self._get_significant_vars(p_values, plot_option, benjamini_sig)
+        
+        logger.info(f"ANOVA: {np.sum(benjamini_sig)} Benjamini significant variables")
+        
+        def records() -> Iterator[dict[str, Any]]:
+            yield {
+                'type': 'summary',
+                'summary': self._summary(p_values, benjamini_sig, bonferroni_sig),
+                'significant_variables': significant_vars
             }
+            
+            for i in np.argsort(p_values, kind='stable'):
+                row = self._result_row(int(i), p_values, fdr_corrected, benjamini_sig, effect_sizes, var_names)
+                yield {'type': 'result', 'index': int(i), **row}
+            
+            for var_idx in significant_vars[:4]:
+                yield {
+                    'type': 'boxplot',
+                    'index': var_idx,
+                    'variable': self._variable_name(var_idx, var_names),
+                    'groups': self._compute_boxplots(data, classes, [var_idx])[0]
+                }
+        
+        return records()
+    
+    def analyze_moments(
+        self,
+        counts: np.ndarray,
+        means: np.ndarray,
+        m2: np.ndarray,
+        plot_option: int,
+        var_names: list[str] | None = None
+    ) -> dict[str, Any]:
+        """
+        Perform One-Way ANOVA from per-group sufficient statistics
+        
+        Used for stored datasets where raw rows are not kept. Kruskal-Wallis
+        needs ranks and is not available; boxplot_data is empty.
+        
+        Args:
+            counts, means, m2: Per-group moments (groups × variables), see group_moments
+            plot_option: Plotting option
+        
+        Returns:
+            ANOVA results (same schema as analyze)
+        """
+        if self.test == 'kruskal':
+            raise ValueError("Kruskal-Wallis requires raw data and cannot run from stored statistics")
+        
+        p_values, effect_sizes = self._test_moments(counts, means, m2)
+        fdr_corrected, benjamini_sig, bonferroni_sig = self._correct(p_values)
+        
+        logger.info(f"ANOVA (from moments): {np.sum(benjamini_sig)} Benjamini significant variables")
+        
+        return {
+            'results': [
+                self._result_row(i, p_values, fdr_corrected, benjamini_sig, effect_sizes, var_names)
+                for i in range(len(p_values))
+            ],
+            'significant_variables': self._get_significant_vars(p_values, plot_option, benjamini_sig),
+            'boxplot_data': [],
+            'summary': self._summary(p_values, benjamini_sig, bonferroni_sig)
+        }
+    
+    def group_moments(
+        self,
+        data: np.ndarray,
+        classes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Per-group (counts, means, sums of squared deviations), NaN-aware
+        
+        Each array is groups × variables, with groups in np.unique(classes) order.
+        """
+        class_idx, one_hot = self._one_hot(classes)
+        
+        valid = ~np.isnan(data)
+        values = np.where(valid, data, 0.0)
+        
+        counts = one_hot.T @ valid
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, (one_hot.T @ values) / counts, 0.0)
+        
+        # Two-pass sums of squares for numerical stability
+        deviations = np.where(valid, data - means[class_idx], 0.0)
+        m2 = one_hot.T @ deviations ** 2
+        
+        return counts, means, m2
+    
+    def _test_variables(
+        self,
+        data: np.ndarray,
+        classes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Compute per-variable p-values and effect sizes (η², %) for all columns at once
+        
+        Group counts, means and sums of squared deviations are computed once
+        (NaN-aware) and shared by every test.
+        """
+        counts, means, m2 = self.group_moments(data, classes)
+        
+        rank_p = None
+        if self.test == 'kruskal':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rank_p = self._kruskal_p(data, classes, counts)
+        
+        return self._test_moments(counts, means, m2, rank_p)
+    
+    def _test_moments(
+        self,
+        counts: np.ndarray,
+        means: np.ndarray,
+        m2: np.ndarray,
+        rank_p: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """p-values (moment-based tests, or rank_p if given) and effect sizes from group moments"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_total = counts.sum(axis=0)
+            n_groups = (counts > 0).sum(axis=0)
+            grand_mean = (counts * means).sum(axis=0) / n_total
+            ss_between = (counts * (means - grand_mean) ** 2).sum(axis=0)
+            ss_within = m2.sum(axis=0)
+            
+            if rank_p is not None:
+                p_values = rank_p
+            elif self.test == 'welch':
+                p_values = self._welch_p(counts, means, m2)
+            else:
+                p_values = self._anova_p(ss_between, ss_within, n_total, n_groups)
+            
+            # Effect size (η²)
+            ss_total = ss_between + ss_within
+            effect_sizes = np.where(ss_total > 0, ss_between / ss_total * 100, 0.0)
+        
+        # Skip if insufficient data
+        insufficient = n_groups < 2
+        p_values = np.where(insufficient | np.isnan(p_values), 1.0, p_values)
+        effect_sizes = np.where(insufficient, 0.0, effect_sizes)
+        
+        return p_values, effect_sizes
+    
+    def _one_hot(self, classes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Group index per sample and samples × groups indicator matrix"""
+        _, class_idx = np.unique(classes, return_inverse=True)
+        one_hot = np.zeros((len(classes), class_idx.max() + 1))
+        one_hot[np.arange(len(classes)), class_idx] = 1.0
+        return class_idx, one_hot
+    
+    def _anova_p(
+        self,
+        ss_between: np.ndarray,
+        ss_within: np.ndarray,
+        n_total: np.ndarray,
+        n_groups: np.ndarray
+    ) -> np.ndarray:
+        """Classical One-Way ANOVA F-test"""
+        df_between = n_groups - 1
+        df_within = n_total - n_groups
+        f_stat = (ss_between / df_between) / (ss_within / df_within)
+        return stats.f.sf(f_stat, df_between, df_within)
+    
+    def _welch_p(self, counts: np.ndarray, means: np.ndarray, m2: np.ndarray) -> np.ndarray:
+        """Welch's heteroscedastic ANOVA (groups with fewer than 2 values are excluded)"""
+        usable = counts >= 2
+        k = usable.sum(axis=0)
+        
+        variances = m2 / (counts - 1)
+        weights = np.where(usable, counts / variances, 0.0)
+        weight_sum = weights.sum(axis=0)
+        weighted_mean = (weights * np.where(usable, means, 0.0)).sum(axis=0) / weight_sum
+        
+        a = (weights * (means - weighted_mean) ** 2).sum(axis=0) / (k - 1)
+        lam = np.where(usable, (1 - weights / weight_sum) ** 2 / (counts - 1), 0.0).sum(axis=0)
+        b = 1 + 2 * (k - 2) / (k ** 2 - 1) * lam
+        
+        df_num = k - 1
+        df_den = (k ** 2 - 1) / (3 * lam)
+        p_values = stats.f.sf(a / b, df_num, df_den)
+        return np.where(k >= 2, p_values, np.nan)
+    
+    def _kruskal_p(
+        self,
+        data: np.ndarray,
+        classes: np.ndarray,
+        counts: np.ndarray
+    ) -> np.ndarray:
+        """Kruskal-Wallis H-test with tie correction"""
+        n_samples, n_vars = data.shape
+        n_total = counts.sum(axis=0)
+        n_groups = (counts > 0).sum(axis=0)
+        _, one_hot = self._one_hot(classes)
+        
+        # Rank every column in one pass (NaNs stay NaN)
+        ranks = stats.rankdata(data, axis=0, nan_policy='omit')
+        rank_sums = one_hot.T @ np.nan_to_num(ranks, nan=0.0)
+        
+        h = 12 / (n_total * (n_total + 1)) * np.where(counts > 0, rank_sums ** 2 / counts, 0.0).sum(axis=0)
+        h -= 3 * (n_total + 1)
+        
+        # Tie correction: sum of (t³ - t) over runs of equal values per column
+        sorted_data = np.sort(data, axis=0)
+        new_run = np.ones(sorted_data.shape, dtype=bool)
+        new_run[1:] = sorted_data[1:] != sorted_data[:-1]
+        run_id = np.cumsum(new_run, axis=0) - 1
+        flat = (run_id + np.arange(n_vars) * n_samples)[~np.isnan(sorted_data)]
+        run_lengths = np.bincount(flat, minlength=n_samples * n_vars).reshape(n_vars, n_samples).astype(float)
+        ties = (run_lengths ** 3 - run_lengths).sum(axis=1)
+        
+        h /= 1 - ties / (n_total ** 3 - n_total)
+        return stats.chi2.sf(h, n_groups - 1)
+    
+    def _correct(self, p_values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Apply multiple testing corrections: (fdr_corrected, benjamini_sig, bonferroni_sig)"""
+        # Bonferroni correction
+        bonferroni_threshold = self.fdr_threshold / len(p_values)
+        bonferroni_sig = p_values <= bonferroni_threshold
+        
+        # Benjamini-Hochberg correction
+        # multipletests returns: (reject, pvals_corrected, alphacSidak, alphacBonf)
+        benjamini_sig, fdr_corrected, _, _ = multipletests(
+            p_values,
+            alpha=self.fdr_threshold,
+            method='fdr_bh'
+        )
+        return fdr_corrected, benjamini_sig, bonferroni_sig
+    
+    def _result_row(
+        self,
+        i: int,
+        p_values: np.ndarray,
+        fdr_corrected: np.ndarray,
+        benjamini_sig: np.ndarray,
+        effect_sizes: np.ndarray,
+        var_names: list[str] | None
+    ) -> dict[str, Any]:
+        """Build the results table row for variable i"""
+        return {
+            'variable': self._variable_name(i, var_names),
+            'pValue': float(p_values[i]),
+            'fdr': float(fdr_corrected[i]),
+            'bonferroni': float(p_values[i] * len(p_values)),  # Adjusted p-value
+            'benjamini': bool(benjamini_sig[i]),
+            'effectSize': float(effect_sizes[i])
+        }
+    
+    def _variable_name(self, i: int, var_names: list[str] | None) -> str:
+        """Display name for variable i"""
+        return var_names[i] if var_names and i < len(var_names) else f'Variable_{i+1}'
+    
+    def _summary(
+        self,
+        p_values: np.ndarray,
+        benjamini_sig: np.ndarray,
+        bonferroni_sig: np.ndarray
+    ) -> dict[str, Any]:
+        """Summary counts across all variables"""
+        return {
+            'total_variables': len(p_values),
+            'benjamini_significant': int(np.sum(benjamini_sig)),
+            'bonferroni_significant': int(np.sum(bonferroni_sig)),
+            'nominal_significant': int(np.sum(p_values <= 0.05)),
+            'fdr_threshold': self.fdr_threshold,
+            'test': self.test
         }
     
     def _get_significant_vars(
         self,
-        results: list[dict],
+        p_values: np.ndarray,
         plot_option: int,
         benjamini_sig: np.ndarray
     ) -> list[int]:
@@ -139,13 +386,13 @@ class AnovaAnalyzer:
         if plot_option == 0:
             return []
         elif plot_option == 1:  # Nominal p-value
-            return [i for i, r in enumerate(results) if r['pValue'] <= 0.05]
+            return np.flatnonzero(p_values <= 0.05).tolist()
         elif plot_option == 2:  # Bonferroni
-            return [i for i, r in enumerate(results) if r['bonferroni'] <= self.fdr_threshold]
+            return np.flatnonzero(p_values * len(p_values) <= self.fdr_threshold).tolist()
         elif plot_option == 3:  # Benjamini-Hochberg
-            return [i for i, r in enumerate(results) if benjamini_sig[i]]
+            return np.flatnonzero(benjamini_sig).tolist()
         else:  # All variables
-            return list(range(len(results)))
+            return list(range(len(p_values)))
     
     def _compute_boxplots(
         self,
@@ -0,0 +1,256 @@
+"""
+Dataset Store Service
+Stored datasets kept as sufficient statistics, updated in place as samples are appended
+
+Per dataset (directory under DATASET_STORE_DIR):
+- meta.json   variable names, class column, group labels, sample count, wave history
+- anova.npz   per-group counts, means and sums of squared deviations
+- pca.npz     row count, column means and centered cross-product matrix (NaN → 0),
+              kept only when variables <= PCA_STATS_MAX_VARS
+
+Appending a wave costs O(new rows × variables) for ANOVA and
+O(new rows × variables²) for PCA; raw rows are never stored.
+Statistics are merged with Chan et al.'s pairwise update, which stays
+numerically stable where raw sums and sums of squares would cancel.
+"""
+import fcntl
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from services.anova import AnovaAnalyzer
+from services.pca import PCAAnalyzer
+
+logger = logging.getLogger(__name__)
+
+STORE_ROOT = Path(os.getenv('DATASET_STORE_DIR', 'datasets'))
+PCA_STATS_MAX_VARS = int(os.getenv('PCA_STATS_MAX_VARS', '4000'))
+
+
+class DatasetNotFoundError(Exception):
+    """No stored dataset with the given id"""
+
+
+class DatasetStore:
+    """File-backed store of per-dataset sufficient statistics"""
+
+    def __init__(self, root: Path = STORE_ROOT, pca_max_vars: int = PCA_STATS_MAX_VARS):
+        self.root = Path(root)
+        self.pca_max_vars = pca_max_vars
+
+    def create(
+        self,
+        data: np.ndarray,
+        labels: np.ndarray,
+        var_names: list[str] | None,
+        class_column: str = ''
+    ) -> dict[str, Any]:
+        """
+        Store a new dataset from its first wave
+
+        Args:
+            data: Data matrix (samples × variables)
+            labels: Stable string class labels per sample
+            var_names: Variable names
+            class_column: Name of the class column in the file ('' for none),
+                used to read the same column from appended waves
+
+        Returns:
+            Dataset info (see info)
+        """
+        dataset_id = uuid.uuid4().hex[:16]
+        entry = self.root / dataset_id
+        entry.mkdir(parents=True)
+
+        names = [str(name) for name in var_names] if var_names else [f'Variable_{i+1}' for i in range(data.shape[1])]
+        meta = {
+            'dataset_id': dataset_id,
+            'var_names': names,
+            'class_column': class_column,
+            'groups': [],
+            'n_samples': 0,
+            'waves': [],
+            'pca_stats': data.shape[1] <= self.pca_max_vars
+        }
+        with self._lock(entry):
+            self._update(entry, meta, data, labels)
+        logger.info(f"Created stored dataset {dataset_id}: {data.shape[0]} × {data.shape[1]}")
+        return self._info(meta)
+
+    def append(
+        self,
+        dataset_id: str,
+        data: np.ndarray,
+        labels: np.ndarray,
+        var_names: list[str] | None
+    ) -> dict[str, Any]:
+        """Merge a new wave of samples into a stored dataset"""
+        entry = self._entry(dataset_id)
+        with self._lock(entry):
+            meta = self._read_meta(entry)
+            names = [str(name) for name in var_names] if var_names else meta['var_names']
+            if names != meta['var_names']:
+                raise ValueError("Appended file must have the same variables, in the same order, as the stored dataset")
+            self._update(entry, meta, data, labels)
+        logger.info(f"Appended {data.shape[0]} samples to {dataset_id} (now {meta['n_samples']})")
+        return self._info(meta)
+
+    def class_column(self, dataset_id: str) -> str | None:
+        """Class column recorded at creation ('' for none; None if not recorded)"""
+        return self._read_meta(self._entry(dataset_id)).get('class_column')
+
+    def info(self, dataset_id: str) -> dict[str, Any]:
+        """Dataset id, size, groups and wave history"""
+        return self._info(self._read_meta(self._entry(dataset_id)))
+
+    def anova(self, dataset_id: str, analyzer: AnovaAnalyzer, plot_option: int) -> dict[str, Any]:
+        """ANOVA results from the stored group moments"""
+        entry = self._entry(dataset_id)
+        with self._lock(entry), np.load(entry / 'anova.npz') as stats:
+            meta = self._read_meta(entry)
+            counts, means, m2 = stats['counts'], stats['means'], stats['m2']
+        results = analyzer.analyze_moments(counts, means, m2, plot_option, meta['var_names'])
+        results['dataset'] = self._info(meta)
+        return results
+
+    def pca(self, dataset_id: str, analyzer: PCAAnalyzer, design_label: str) -> dict[str, Any]:
+        """PCA results from the stored cross-product matrix"""
+        entry = self._entry(dataset_id)
+        with self._lock(entry):
+            meta = self._read_meta(entry)
+            if not meta['pca_stats']:
+                raise ValueError(
+                    f"PCA statistics are not kept for datasets with more than {self.pca_max_vars} variables"
+                )
+            with np.load(entry / 'pca.npz') as stats:
+                n_samples, m2 = int(stats['n']), stats['m2']
+        results = analyzer.analyze_covariance(n_samples, m2, design_label, meta['var_names'])
+        results['dataset'] = self._info(meta)
+        return results
+
+    def _update(self, entry: Path, meta: dict, data: np.ndarray, labels: np.ndarray) -> None:
+        """Merge one wave into the stored statistics (caller holds the lock)"""
+        data = np.asarray(data, dtype=np.float64)
+        labels = np.asarray(labels).astype(str)
+
+        # Map wave labels onto stored group order, registering new groups
+        wave_groups = np.unique(labels)
+        for label in wave_groups:
+            if label not in meta['groups']:
+                meta['groups'].append(str(label))
+        n_groups, n_vars = len(meta['groups']), data.shape[1]
+        rows = np.array([meta['groups'].index(label) for label in wave_groups])
+
+        # ANOVA: per-group moments of the new rows, merged into stored moments
+        counts_b = np.zeros((n_groups, n_vars))
+        means_b = np.zeros((n_groups, n_vars))
+        m2_b = np.zeros((n_groups, n_vars))
+        counts_b[rows], means_b[rows], m2_b[rows] = AnovaAnalyzer().group_moments(data, labels)
+
+        anova_path = entry / 'anova.npz'
+        if anova_path.exists():
+            with np.load(anova_path) as stored:
+                counts_a = _pad_rows(stored['counts'], n_groups)
+                means_a = _pad_rows(stored['means'], n_groups)
+                m2_a = _pad_rows(stored['m2'], n_groups)
+            counts, means, m2 = _merge_moments(counts_a, means_a, m2_a, counts_b, means_b, m2_b)
+        else:
+            counts, means, m2 = counts_b, means_b, m2_b
+        _save_npz(anova_path, counts=counts, means=means, m2=m2)
+
+        # PCA: column means and centered cross-products (NaN → 0, as in PCAAnalyzer)
+        if meta['pca_stats']:
+            values = np.nan_to_num(data, nan=0.0)
+            n_b = values.shape[0]
+            mean_b = values.mean(axis=0)
+            centered = values - mean_b
+            m2_pca_b = centered.T @ centered
+
+            pca_path = entry / 'pca.npz'
+            if pca_path.exists():
+                with np.load(pca_path) as stored:
+                    n_a, mean_a, m2_pca = int(stored['n']), stored['mean'], stored['m2']
+                delta = mean_b - mean_a
+                n = n_a + n_b
+                mean = mean_a + delta * n_b / n
+                m2_pca = m2_pca + m2_pca_b + np.outer(delta, delta) * (n_a * n_b / n)
+            else:
+                n, mean, m2_pca = n_b, mean_b, m2_pca_b
+            _save_npz(pca_path, n=np.array(n), mean=mean, m2=m2_pca)
+
+        meta['n_samples'] += data.shape[0]
+        meta['waves'].append({
+            'n_samples': int(data.shape[0]),
+            'added_at': datetime.now().isoformat(timespec='seconds')
+        })
+        _write_json(entry / 'meta.json', meta)
+
+    def _entry(self, dataset_id: str) -> Path:
+        entry = self.root / dataset_id
+        if not dataset_id.isalnum() or not (entry / 'meta.json').exists():
+            raise DatasetNotFoundError(f"Dataset not found: {dataset_id}")
+        return entry
+
+    def _read_meta(self, entry: Path) -> dict:
+        return json.loads((entry / 'meta.json').read_text())
+
+    def _info(self, meta: dict) -> dict[str, Any]:
+        return {
+            'dataset_id': meta['dataset_id'],
+            'n_samples': meta['n_samples'],
+            'n_variables': len(meta['var_names']),
+            'class_column': meta.get('class_column'),
+            'groups': meta['groups'],
+            'waves': meta['waves'],
+            'pca_available': meta['pca_stats']
+        }
+
+    @contextmanager
+    def _lock(self, entry: Path):
+        """Exclusive per-dataset lock so concurrent appends from any worker serialize"""
+        with open(entry / '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pad_rows(array: np.ndarray, n_rows: int) -> np.ndarray:
+    """Zero-pad a groups × variables array for newly added groups"""
+    if array.shape[0] == n_rows:
+        return array
+    return np.vstack([array, np.zeros((n_rows - array.shape[0], array.shape[1]))])
+
+
+def _merge_moments(
+    counts_a: np.ndarray, means_a: np.ndarray, m2_a: np.ndarray,
+    counts_b: np.ndarray, means_b: np.ndarray, m2_b: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Combine two sets of (count, mean, M2) moments elementwise"""
+    counts = counts_a + counts_b
+    delta = means_b - means_a
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(counts > 0, means_a + delta * counts_b / counts, 0.0)
+        m2 = m2_a + m2_b + np.where(counts > 0, delta ** 2 * counts_a * counts_b / counts, 0.0)
+    return counts, means, m2
+
+
+def _save_npz(path: Path, **arrays: np.ndarray) -> None:
+    """Write arrays atomically (readers never see a partial file)"""
+    tmp = path.with_name(path.stem + '.tmp.npz')
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _write_json(path: Path, payload: dict) -> None:
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(payload, indent=2))
+    os.replace(tmp, path)
@@ -16,9 +16,24 @@ logger = logging.getLogger(__name__)
 class PCAAnalyzer:
     """PCA analyzer with preprocessing"""
     
-    def __init__(self, n_components: int = 3, scaling: str = 'auto'):
+    def __init__(
+        self,
+        n_components: int = 3,
+        scaling: str = 'auto',
+        aggregate: bool = False,
+        max_points: int = 5000,
+        density_bins: int = 50,
+        top_loadings: int = 50,
+        pc_pairs: list[tuple[int, int]] | None = None
+    ):
         self.n_components = min(n_components, 10)  # Max 10 PCs
         self.scaling = scaling
+        # Aggregation mode (large sample counts): densities + sampled points
+        self.aggregate = aggregate
+        self.max_points = max_points
+        self.density_bins = density_bins
+        self.top_loadings = top_loadings
+        self.pc_pairs = pc_pairs
     
     def analyze(
         self,
@@ -56,24 +71,102 @@ class PCAAnalyzer:
         explained_var = pca.explained_variance_ratio_ * 100
         cumulative_var = np.cumsum(explained_var)
         
-        # Build scores data
-        scores_data = []
-        for i in range(n_samples):
-            score_dict = {
-                'sample': f'Sample_{i+1}',
-                'group': int(classes[i]) if i < len(classes) else 1
-            }
-            for pc in range(self.n_components):
-                score_dict[f'pc{pc+1}'] = float(scores[i, pc])
-            scores_data.append(score_dict)
+        groups = np.ones(n_samples, dtype=int)
+        n_labeled = min(len(classes), n_samples)
+        groups[:n_labeled] = classes[:n_labeled]
+        
+        summary = {
+            'n_components': self.n_components,
+            'scaling_method': self.scaling,
+            'total_variance_explained': float(cumulative_var[-1]),
+            'design_label': design_label
+        }
         
         logger.info(f"PCA: PC1 explains {explained_var[0]:.1f}% variance")
         
+        if not self.aggregate:
+            return {
+                'scores': self._build_scores(scores, groups, np.arange(n_samples)),
+                'explainedVariance': explained_var.tolist(),
+                'cumulativeVariance': cumulative_var.tolist(),
+                'loadings': pca.components_.tolist(),  # Shape: (n_components, n_features)
+                'summary': summary
+            }
+        
+        sample_idx = self._stratified_sample(groups)
+        logger.info(f"PCA aggregation: {len(sample_idx)} of {n_samples} points returned")
+        
         return {
-            'scores': scores_data,
+            'scores': self._build_scores(scores, groups, sample_idx),
+            'density': self._score_densities(scores, groups),
+            'explainedVariance': explained_var.tolist(),
+            'cumulativeVariance': cumulative_var.tolist(),
+            'topLoadings': self._top_loadings(pca.components_, var_names),
+            'summary': {
+                **summary,
+                'aggregated': True,
+                'n_samples': n_samples,
+                'n_points_returned': len(sample_idx)
+            }
+        }
+    
+    def analyze_covariance(
+        self,
+        n_samples: int,
+        m2: np.ndarray,
+        design_label: str,
+        var_names: list[str] | None = None
+    ) -> dict[str, Any]:
+        """
+        Perform PCA from accumulated statistics instead of raw rows
+        
+        Equivalent to analyze() on the same (NaN → 0) data: the scaling is
+        applied to the covariance matrix and components come from its
+        eigendecomposition. Per-sample scores are not available.
+        
+        Args:
+            n_samples: Number of rows accumulated
+            m2: Centered cross-product matrix Σ(x - mean)(x - mean)ᵀ (variables × variables)
+            design_label: Name of the design factor
+        
+        Returns:
+            PCA results with loadings and explained variance (no scores)
+        """
+        n_vars = m2.shape[0]
+        logger.info(f"Running PCA from covariance of {n_samples} samples × {n_vars} variables")
+        
+        cov = m2 / (n_samples - 1)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        std[std == 0] = 1  # Avoid division by zero (as in scale_data)
+        
+        if self.scaling == 'auto':
+            scale = 1 / std
+        elif self.scaling == 'mean':
+            scale = np.ones(n_vars)
+        elif self.scaling == 'pareto':
+            scale = 1 / np.sqrt(std)
+        else:
+            raise ValueError(f"Unknown scaling method: {self.scaling}")
+        logger.info(f"Applied {self.scaling} scaling")
+        
+        cov_scaled = cov * np.outer(scale, scale)
+        eigvals, eigvecs = np.linalg.eigh(cov_scaled)
+        order = np.argsort(eigvals)[::-1][:self.n_components]
+        components = eigvecs[:, order].T
+        
+        # Same sign convention as sklearn (largest |loading| positive)
+        signs = np.sign(components[np.arange(len(order)), np.argmax(np.abs(components), axis=1)])
+        components *= signs[:, None]
+        
+        explained_var = np.clip(eigvals[order], 0, None) / np.trace(cov_scaled) * 100
+        cumulative_var = np.cumsum(explained_var)
+        
+        logger.info(f"PCA: PC1 explains {explained_var[0]:.1f}% variance")
+        
+        results = {
+            'scores': [],
             'explainedVariance': explained_var.tolist(),
             'cumulativeVariance': cumulative_var.tolist(),
-            'loadings': pca.components_.tolist(),  # Shape: (n_components, n_features)
             'summary': {
                 'n_components': self.n_components,
                 'scaling_method': self.scaling,
@@ -81,4 +174,121 @@ class PCAAnalyzer:
                 'design_label': design_label
             }
         }
+        if self.aggregate:
+            results['topLoadings'] = self._top_loadings(components, var_names)
+        else:
+            results['loadings'] = components.tolist()
+        return results
+    
+    def _build_scores(
+        self,
+        scores: np.ndarray,
+        groups: np.ndarray,
+        sample_idx: np.ndarray
+    ) -> list[dict[str, Any]]:
+        """Build per-sample score records for the given sample indices"""
+        scores_data = []
+        for i in sample_idx:
+            score_dict = {
+                'sample': f'Sample_{i+1}',
+                'group': int(groups[i])
+            }
+            for pc in range(self.n_components):
+                score_dict[f'pc{pc+1}'] = float(scores[i, pc])
+            scores_data.append(score_dict)
+        return scores_data
+    
+    def _stratified_sample(self, groups: np.ndarray) -> np.ndarray:
+        """
+        Pick at most max_points samples, allocated to groups proportionally
+        
+        Every group keeps one point and the rest of the budget is split by
+        largest remainder. With more groups than max_points, only the
+        max_points largest groups are represented (one point each).
+        """
+        n_samples = len(groups)
+        if n_samples <= self.max_points:
+            return np.arange(n_samples)
+        
+        labels, group_idx, counts = np.unique(groups, return_inverse=True, return_counts=True)
+        n_groups = len(labels)
+        quota = np.zeros(n_groups, dtype=int)
+        if n_groups >= self.max_points:
+            quota[np.argsort(-counts, kind='stable')[:max(self.max_points, 0)]] = 1
+        else:
+            # One reserved point per group; share the remainder by group size
+            # (ideal <= counts - 1, so rounding up a fraction never exceeds a group)
+            extra = self.max_points - n_groups
+            ideal = (counts - 1) * extra / (n_samples - n_groups)
+            quota = 1 + np.floor(ideal).astype(int)
+            leftover = self.max_points - quota.sum()
+            quota[np.argsort(np.floor(ideal) - ideal, kind='stable')[:leftover]] += 1
+        
+        # Rank samples within their group by a random key; keep the first quota[g]
+        rng = np.random.default_rng(0)
+        order = np.lexsort((rng.random(n_samples), group_idx))
+        group_start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        rank = np.arange(n_samples) - group_start[group_idx[order]]
+        
+        return np.sort(order[rank < quota[group_idx[order]]])
+    
+    def _score_densities(self, scores: np.ndarray, groups: np.ndarray) -> list[dict[str, Any]]:
+        """2D binned score counts per group for each requested PC pair"""
+        bins = self.density_bins
+        labels, group_idx = np.unique(groups, return_inverse=True)
+        n_groups = len(labels)
+        
+        pairs = self.pc_pairs or [
+            (a + 1, b + 1) for a in range(self.n_components) for b in range(a + 1, self.n_components)
+        ]
+        
+        densities = []
+        for pc_x, pc_y in pairs:
+            if not (1 <= pc_x <= self.n_components and 1 <= pc_y <= self.n_components):
+                raise ValueError(f"PC pair out of range: ({pc_x}, {pc_y})")
+            x = scores[:, pc_x - 1]
+            y = scores[:, pc_y - 1]
+            x_edges = np.linspace(x.min(), x.max(), bins + 1)
+            y_edges = np.linspace(y.min(), y.max(), bins + 1)
+            
+            # Bin all groups at once: flat index = (group, x_bin, y_bin)
+            x_bin = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, bins - 1)
+            y_bin = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, bins - 1)
+            flat = (group_idx * bins + x_bin) * bins + y_bin
+            counts = np.bincount(flat, minlength=n_groups * bins * bins).reshape(n_groups, bins, bins)
+            
+            densities.append({
+                'pcX': pc_x,
+                'pcY': pc_y,
+                'xEdges': x_edges.tolist(),
+                'yEdges': y_edges.tolist(),
+                'groups': [
+                    {'group': int(label), 'counts': counts[g].tolist()}  # counts[x_bin][y_bin]
+                    for g, label in enumerate(labels)
+                ]
+            })
+        return densities
+    
+    def _top_loadings(
+        self,
+        components: np.ndarray,
+        var_names: list[str] | None
+    ) -> list[list[dict[str, Any]]]:
+        """Top-N variables by absolute loading for each component"""
+        n_top = min(self.top_loadings, components.shape[1])
+        magnitude = np.abs(components)
+        top = np.argpartition(-magnitude, n_top - 1, axis=1)[:, :n_top]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(magnitude, top, axis=1), axis=1), axis=1)
+        
+        return [
+            [
+                {
+                    'index': int(j),
+                    'variable': var_names[j] if var_names and j < len(var_names) else f'Variable_{j+1}',
+                    'loading': float(components[pc, j])
+                }
+                for j in top[pc]
+            ]
+            for pc in range(components.shape[0])
+        ]
 
@@ -0,0 +1,268 @@
+"""
+Admission Control
+Per-endpoint concurrency limits, memory budgeting and a bounded wait queue
+
+Each analysis request or dataset upload is admitted only if its endpoint
+has a free slot and its estimated memory cost fits the remaining budget.
+Otherwise it waits in a bounded FIFO queue:
+- queue full           -> 429 Too Many Requests (Retry-After)
+- waited too long      -> 503 Service Unavailable (Retry-After)
+- cost exceeds budget  -> 413 Payload Too Large
+
+Admission happens in ASGI middleware, before the upload body is read, and
+the slot is held until the response (including streamed bodies) completes.
+State is per worker process; size the budget for one worker.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Cost model: raw upload held twice (spooled file + read() bytes) plus
+# several float64 copies of the matrix during parsing, scaling and analysis
+MATRIX_COPIES = 6
+BYTES_PER_CELL = 10  # typical CSV text per numeric cell, used when shape is not declared
+
+
+class AdmissionRejected(Exception):
+    """Request cannot be admitted"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int | None = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def estimate_cost(content_length: int | None, shape: tuple[int, int] | None, default_cost: int) -> int:
+    """
+    Estimate peak memory (bytes) for one request
+
+    Args:
+        content_length: Declared request size, if any
+        shape: Declared (samples, variables), if any
+        default_cost: Cost assumed when the size is unknown
+    """
+    if content_length is None:
+        return default_cost
+    cells = shape[0] * shape[1] if shape else content_length / BYTES_PER_CELL
+    return int(2 * content_length + cells * 8 * MATRIX_COPIES)
+
+
+@dataclass
+class _Waiter:
+    endpoint: str
+    cost: int
+    future: asyncio.Future = field(repr=False)
+
+
+class AdmissionController:
+    """Admission state for one worker process"""
+
+    def __init__(
+        self,
+        limits: dict[str, int],
+        memory_budget: int,
+        max_queue: int = 16,
+        max_wait: float = 30.0,
+        default_cost: int = 256 * MB
+    ):
+        self.limits = limits
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_cost = default_cost
+
+        self.active = {endpoint: 0 for endpoint in limits}
+        self.memory_in_use = 0
+        self.waiters: deque[_Waiter] = deque()
+        self.counters = {'admitted': 0, 'queued': 0, 'rejected_413': 0, 'rejected_429': 0, 'rejected_503': 0}
+        self._service_time = {endpoint: 1.0 for endpoint in limits}  # EWMA seconds
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        """Build from ADMISSION_* environment variables"""
+        return cls(
+            limits={
+                'anova': int(os.getenv('ADMISSION_ANOVA_CONCURRENCY', '2')),
+                'pca': int(os.getenv('ADMISSION_PCA_CONCURRENCY', '2')),
+                'datasets': int(os.getenv('ADMISSION_DATASETS_CONCURRENCY', '2')),
+            },
+            memory_budget=int(os.getenv('ADMISSION_MEMORY_BUDGET_MB', '1024')) * MB,
+            max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '16')),
+            max_wait=float(os.getenv('ADMISSION_MAX_WAIT_S', '30')),
+            default_cost=int(os.getenv('ADMISSION_DEFAULT_COST_MB', '256')) * MB,
+        )
+
+    def _fits(self, endpoint: str, cost: int) -> bool:
+        return (
+            self.active[endpoint] < self.limits[endpoint]
+            and self.memory_in_use + cost <= self.memory_budget
+        )
+
+    def _admit(self, endpoint: str, cost: int) -> None:
+        self.active[endpoint] += 1
+        self.memory_in_use += cost
+        self.counters['admitted'] += 1
+
+    def retry_after(self, endpoint: str) -> int:
+        """Seconds until a slot is likely free, from queue depth and service time"""
+        backlog = len(self.waiters) + 1
+        return max(1, math.ceil(self._service_time[endpoint] * backlog / max(1, self.limits[endpoint])))
+
+    async def acquire(self, endpoint: str, cost: int) -> None:
+        """Wait for admission or raise AdmissionRejected"""
+        if cost > self.memory_budget:
+            self.counters['rejected_413'] += 1
+            raise AdmissionRejected(
+                413,
+                f"Estimated memory {cost // MB} MB exceeds budget {self.memory_budget // MB} MB"
+            )
+
+        if not self.waiters and self._fits(endpoint, cost):
+            self._admit(endpoint, cost)
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            self.counters['rejected_429'] += 1
+            raise AdmissionRejected(429, "Server busy: admission queue full", self.retry_after(endpoint))
+
+        waiter = _Waiter(endpoint, cost, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        self.counters['queued'] += 1
+
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.counters['rejected_503'] += 1
+            raise AdmissionRejected(503, "Server busy: admission wait timed out", self.retry_after(endpoint))
+        except asyncio.CancelledError:
+            # Client went away; give back the slot if we were admitted meanwhile
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(endpoint, cost)
+            else:
+                self._discard(waiter)
+            raise
+
+    def release(self, endpoint: str, cost: int, elapsed: float | None = None) -> None:
+        """Return a slot and wake queued requests that now fit"""
+        self.active[endpoint] -= 1
+        self.memory_in_use -= cost
+        if elapsed is not None:
+            self._service_time[endpoint] = 0.8 * self._service_time[endpoint] + 0.2 * elapsed
+        self._wake()
+
+    def _discard(self, waiter: _Waiter) -> None:
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._wake()
+
+    def _wake(self) -> None:
+        """Admit waiters in FIFO order, skipping those that do not fit yet"""
+        for waiter in list(self.waiters):
+            if waiter.future.done():
+                self.waiters.remove(waiter)
+            elif self._fits(waiter.endpoint, waiter.cost):
+                self.waiters.remove(waiter)
+                self._admit(waiter.endpoint, waiter.cost)
+                waiter.future.set_result(None)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Current admission state for monitoring"""
+        return {
+            'endpoints': {
+                endpoint: {
+                    'active': self.active[endpoint],
+                    'limit': self.limits[endpoint],
+                    'queued': sum(1 for w in self.waiters if w.endpoint == endpoint),
+                    'avg_service_s': round(self._service_time[endpoint], 3)
+                }
+                for endpoint in self.limits
+            },
+            'memory_in_use_mb': round(self.memory_in_use / MB, 1),
+            'memory_budget_mb': round(self.memory_budget / MB, 1),
+            'queue_length': len(self.waiters),
+            'max_queue': self.max_queue,
+            'max_wait_s': self.max_wait,
+            'counters': dict(self.counters),
+            'pid': os.getpid()
+        }
+
+
+def _parse_shape(value: str | None) -> tuple[int, int] | None:
+    """Parse an X-Dataset-Shape header ("samplesxvariables")"""
+    if not value:
+        return None
+    try:
+        n_samples, n_vars = (int(x) for x in value.lower().split('x'))
+    except ValueError:
+        return None
+    return n_samples, n_vars
+
+
+def _path_pattern(template: str) -> re.Pattern:
+    """Regex for a route template; each {param} matches one path segment"""
+    parts = re.split(r'\{[^/{}]+\}', template)
+    return re.compile('^' + '[^/]+'.join(re.escape(part) for part in parts) + '$')
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying AdmissionController to selected paths
+
+    Paths are exact URL paths or route templates with {param} segments,
+    e.g. "/api/datasets/{dataset_id}/append".
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController, paths: dict[str, str]):
+        self.app = app
+        self.controller = controller
+        self.paths = {path: endpoint for path, endpoint in paths.items() if '{' not in path}
+        self.patterns = [(_path_pattern(path), endpoint) for path, endpoint in paths.items() if '{' in path]
+
+    def endpoint_for(self, path: str) -> str | None:
+        """Endpoint name for a URL path, or None if not admission-controlled"""
+        endpoint = self.paths.get(path)
+        if endpoint is None:
+            endpoint = next((name for pattern, name in self.patterns if pattern.match(path)), None)
+        return endpoint
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        endpoint = self.endpoint_for(scope.get('path', '')) if scope['type'] == 'http' else None
+        if endpoint is None or scope.get('method') != 'POST':
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+        content_length = int(headers['content-length']) if headers.get('content-length', '').isdigit() else None
+        cost = estimate_cost(content_length, _parse_shape(headers.get('x-dataset-shape')), self.controller.default_cost)
+
+        try:
+            await self.controller.acquire(endpoint, cost)
+        except AdmissionRejected as e:
+            logger.warning(f"⛔ {endpoint} rejected ({e.status_code}): {e.detail}")
+            response_headers = {'Retry-After': str(e.retry_after)} if e.retry_after else None
+            response = JSONResponse({'detail': e.detail}, status_code=e.status_code, headers=response_headers)
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(endpoint, cost, time.perf_counter() - started)
@@ -0,0 +1,104 @@
+"""
+Excel Reader Utility
+Fast workbook parsing with a columnar (Parquet) cache keyed by content hash
+
+Each (workbook, sheet) is parsed once — with the Rust calamine engine when
+available, openpyxl otherwise — and stored as Parquet under EXCEL_CACHE_DIR.
+Later uploads of the same workbook load the Parquet file instead of
+re-parsing the XML.
+"""
+import logging
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv('EXCEL_CACHE_DIR', str(Path(tempfile.gettempdir()) / 'kkh-excel-cache')))
+CACHE_MAX_BYTES = int(os.getenv('EXCEL_CACHE_MAX_MB', '1024')) * 1024 * 1024
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = None  # pandas default (openpyxl)
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+def read_excel_cached(contents: bytes, key: str, sheet_name: str | int = 0) -> pd.DataFrame:
+    """
+    Read one sheet of an Excel workbook, using the columnar cache when possible
+
+    Args:
+        contents: Raw workbook bytes
+        key: Content hash of the workbook and sheet (see utils.shared_datasets.dataset_key)
+        sheet_name: Sheet name or zero-based index (default: first sheet)
+
+    Returns:
+        Sheet as a DataFrame with string column names
+    """
+    cache_path = CACHE_DIR / f'{key}.parquet'
+
+    if HAS_PARQUET and cache_path.exists():
+        try:
+            df = pd.read_parquet(cache_path)
+            cache_path.touch()  # LRU bookkeeping
+            logger.info(f"Loaded cached sheet {sheet_name!r}: {df.shape[0]} rows × {df.shape[1]} columns")
+            return df
+        except Exception as e:
+            logger.warning(f"Discarding unreadable Excel cache {cache_path.name}: {e}")
+            cache_path.unlink(missing_ok=True)
+
+    df = pd.read_excel(BytesIO(contents), sheet_name=sheet_name, engine=EXCEL_ENGINE)
+    # Parquet needs string column names; apply the same on cold and warm paths
+    df.columns = [str(col) for col in df.columns]
+    logger.info(f"Parsed sheet {sheet_name!r} with {EXCEL_ENGINE or 'openpyxl'} engine")
+
+    if HAS_PARQUET:
+        _write_cache(df, cache_path)
+
+    return df
+
+
+def _write_cache(df: pd.DataFrame, cache_path: Path) -> None:
+    """Write sheet to the cache atomically; failures only disable caching"""
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix='.tmp', delete=False) as tmp:
+            tmp_path = Path(tmp.name)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.warning(f"Excel cache write skipped: {e}")
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
+        return
+
+    _evict(CACHE_MAX_BYTES)
+
+
+def _evict(max_bytes: int) -> None:
+    """Drop least recently used cache files until under max_bytes"""
+    entries = []
+    for path in CACHE_DIR.glob('*.parquet'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
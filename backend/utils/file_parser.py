@@ -8,11 +8,18 @@ from io import BytesIO
 import numpy as np
 import pandas as pd
 from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from utils.excel_reader import read_excel_cached
+from utils.shared_datasets import SharedDataset, attach_dataset, dataset_key, parse_lock, publish_dataset
 
 logger = logging.getLogger(__name__)
 
 
-async def parse_uploaded_file(file: UploadFile) -> tuple[np.ndarray, np.ndarray, list[str] | None]:
+async def parse_uploaded_file(
+    file: UploadFile,
+    sheet_name: str | int = 0
+) -> tuple[np.ndarray, np.ndarray, list[str] | None]:
     """
     Parse uploaded CSV or Excel file
     
@@ -23,96 +30,220 @@ async def parse_uploaded_file(file: UploadFile) -> tuple[np.ndarray, np.ndarray,
     
     Args:
         file: Uploaded file
+        sheet_name: Excel sheet name or index (ignored for CSV)
     
     Returns:
         (data, classes, variable_names) tuple
     """
     try:
         contents = await file.read()
+        return _parse_contents(contents, file.filename, sheet_name)
         
-        # Determine file type
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(BytesIO(contents))
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(BytesIO(contents))
-        else:
-            raise ValueError(f"Unsupported file format: {file.filename}")
-        
-        # Remove completely empty rows
-        df = df.dropna(how='all')
-        
-        logger.info(f"Loaded file: {df.shape[0]} rows × {df.shape[1]} columns")
+    except Exception as e:
+        logger.error(f"File parsing failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"File parsing error: {str(e)}")
+
+
+async def parse_dataset_wave(
+    file: UploadFile,
+    sheet_name: str | int = 0,
+    class_column: str | None = None,
+    min_samples: int = 3
+) -> tuple[np.ndarray, np.ndarray, list[str] | None, str]:
+    """
+    Parse one wave of a stored dataset, with stable string class labels
+    
+    The first wave detects the class column; later waves pass the name it
+    recorded, since detection needs several groups per file and a wave may
+    hold a single (new) group.
+    
+    Args:
+        file: Uploaded file
+        sheet_name: Excel sheet name or index (ignored for CSV)
+        class_column: Class column name to use instead of detection ('' for none)
+        min_samples: Minimum rows in the wave (appended waves may hold one sample)
+    
+    Returns:
+        (data, classes, variable_names, class_column) tuple; class_column is ''
+        when the file has no class column
+    """
+    try:
+        contents = await file.read()
+        return _parse_table(
+            contents, file.filename, sheet_name,
+            stable_labels=True, class_column=class_column, min_samples=min_samples
+        )
         
-        # Find class column automatically
-        class_col_idx, class_col_name = _find_class_column(df)
+    except Exception as e:
+        logger.error(f"File parsing failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"File parsing error: {str(e)}")
+
+
+async def load_shared_dataset(file: UploadFile, sheet_name: str | int = 0) -> SharedDataset:
+    """
+    Parse uploaded file once and share the result across workers
+    
+    Identical uploads (by content hash) attach to the buffers published by
+    whichever worker parsed them first instead of parsing again. If the
+    registry cannot be used (e.g. /dev/shm full), a private handle over
+    the parsed arrays is returned instead.
+    
+    Args:
+        file: Uploaded file
+        sheet_name: Excel sheet name or index (ignored for CSV)
+    
+    Returns:
+        SharedDataset handle; release it (or use as a context manager) when done
+    """
+    try:
+        contents = await file.read()
+        key = dataset_key(contents, file.filename, sheet_name)
         
-        if class_col_idx is not None:
-            # Convert class column (handles integers and letters)
-            classes = _convert_to_class_labels(df.iloc[:, class_col_idx])
-            logger.info(f"Using '{class_col_name}' as class column")
-            
-            # Get numeric data columns (skip class column and ID columns)
-            id_keywords = ['id', 'sample', 'patient', 'subject', 'name']
-            
-            # Find columns to keep (skip class and IDs)
-            cols_to_use = []
-            for idx, col_name in enumerate(df.columns):
-                if idx == class_col_idx:
-                    continue  # Skip class column
-                col_lower = str(col_name).lower()
-                if any(keyword in col_lower for keyword in id_keywords):
-                    logger.info(f"Skipping ID column: {col_name}")
-                    continue  # Skip ID columns
-                cols_to_use.append(col_name)
-            
-            data_cols = df[cols_to_use]
-            
-            # Select only numeric columns
-            numeric_cols = data_cols.select_dtypes(include=[np.number]).columns
-            
-            # If no numeric columns found, try to convert
-            if len(numeric_cols) == 0:
-                data_cols = data_cols.apply(pd.to_numeric, errors='coerce')
-                numeric_cols = data_cols.columns[~data_cols.isna().all()]
-            
-            data = data_cols[numeric_cols].values
-            var_names = list(numeric_cols)
-            
-            logger.info(f"Selected {len(numeric_cols)} numeric columns for analysis: {var_names[:10]}...")
-            
-            # Remove rows with all NaN in data
-            valid_rows = ~np.all(np.isnan(data), axis=1)
-            data = data[valid_rows]
-            classes = classes[valid_rows]
-            
-        else:
-            # All columns are data, generate default classes
-            data = df.apply(pd.to_numeric, errors='coerce').values
-            
-            # Remove rows with all NaN
-            valid_rows = ~np.all(np.isnan(data), axis=1)
-            data = data[valid_rows]
-            
-            classes = np.ones(data.shape[0], dtype=int)
-            var_names = list(df.columns)
-            logger.warning("No class column detected, using default class=1 for all samples")
-        
-        # Validate
-        if data.shape[0] < 3:
-            raise ValueError("Insufficient samples (minimum 3 required)")
-        if data.shape[1] < 2:
-            raise ValueError("Insufficient variables (minimum 2 required)")
-        
-        logger.info(f"Parsed: {data.shape[0]} samples × {data.shape[1]} variables, {len(np.unique(classes))} classes")
-        
-        # var_names should already be set in either branch
-        return data, classes, var_names
+        # parse_lock may wait on another worker's parse; keep that off the event loop
+        return await run_in_threadpool(_attach_or_publish, contents, file.filename, sheet_name, key)
         
     except Exception as e:
         logger.error(f"File parsing failed: {str(e)}")
         raise HTTPException(status_code=400, detail=f"File parsing error: {str(e)}")
 
 
+def _attach_or_publish(contents: bytes, filename: str, sheet_name: str | int, key: str) -> SharedDataset:
+    """Attach to a registered copy, or parse and publish one (blocking; run in a thread)"""
+    with parse_lock(key):
+        try:
+            handle = attach_dataset(key)
+        except OSError as e:
+            logger.warning(f"Shared dataset registry unavailable: {e}")
+            handle = None
+        if handle is not None:
+            return handle
+        
+        data, classes, var_names = _parse_contents(contents, filename, sheet_name, key)
+        try:
+            return publish_dataset(key, data, classes, var_names)
+        except OSError as e:
+            logger.warning(f"Could not share dataset {key}, using a private copy: {e}")
+            return SharedDataset.private(data, classes, var_names)
+
+
+def _parse_contents(
+    contents: bytes,
+    filename: str,
+    sheet_name: str | int = 0,
+    key: str | None = None,
+    stable_labels: bool = False
+) -> tuple[np.ndarray, np.ndarray, list[str] | None]:
+    """
+    Parse raw file bytes into (data, classes, variable_names)
+    
+    With stable_labels, classes are string labels that do not depend on which
+    other labels appear in the file (see _stable_class_labels).
+    """
+    data, classes, var_names, _ = _parse_table(contents, filename, sheet_name, key, stable_labels)
+    return data, classes, var_names
+
+
+def _parse_table(
+    contents: bytes,
+    filename: str,
+    sheet_name: str | int = 0,
+    key: str | None = None,
+    stable_labels: bool = False,
+    class_column: str | None = None,
+    min_samples: int = 3
+) -> tuple[np.ndarray, np.ndarray, list[str] | None, str]:
+    """
+    Parse raw file bytes into (data, classes, variable_names, class_column)
+    
+    class_column names the class column instead of detecting it ('' for none);
+    the returned name is '' when the file has no class column.
+    """
+    # Determine file type
+    if filename.endswith('.csv'):
+        df = pd.read_csv(BytesIO(contents))
+    elif filename.endswith(('.xlsx', '.xls')):
+        key = key or dataset_key(contents, filename, sheet_name)
+        df = read_excel_cached(contents, key, sheet_name)
+    else:
+        raise ValueError(f"Unsupported file format: {filename}")
+    
+    # Remove completely empty rows
+    df = df.dropna(how='all')
+    
+    logger.info(f"Loaded file: {df.shape[0]} rows × {df.shape[1]} columns")
+    
+    # Find class column automatically, unless the caller names it
+    if class_column is None:
+        class_col_idx, class_col_name = _find_class_column(df)
+    else:
+        class_col_idx, class_col_name = _named_class_column(df, class_column)
+    
+    if class_col_idx is not None:
+        # Convert class column (handles integers and letters)
+        if stable_labels:
+            classes = _stable_class_labels(df.iloc[:, class_col_idx])
+        else:
+            classes = _convert_to_class_labels(df.iloc[:, class_col_idx])
+        logger.info(f"Using '{class_col_name}' as class column")
+        
+        # Get numeric data columns (skip class column and ID columns)
+        id_keywords = ['id', 'sample', 'patient', 'subject', 'name']
+        
+        # Find columns to keep (skip class and IDs)
+        cols_to_use = []
+        for idx, col_name in enumerate(df.columns):
+            if idx == class_col_idx:
+                continue  # Skip class column
+            col_lower = str(col_name).lower()
+            if any(keyword in col_lower for keyword in id_keywords):
+                logger.info(f"Skipping ID column: {col_name}")
+                continue  # Skip ID columns
+            cols_to_use.append(col_name)
+        
+        data_cols = df[cols_to_use]
+        
+        # Select only numeric columns
+        numeric_cols = data_cols.select_dtypes(include=[np.number]).columns
+        
+        # If no numeric columns found, try to convert
+        if len(numeric_cols) == 0:
+            data_cols = data_cols.apply(pd.to_numeric, errors='coerce')
+            numeric_cols = data_cols.columns[~data_cols.isna().all()]
+        
+        data = data_cols[numeric_cols].values
+        var_names = list(numeric_cols)
+        
+        logger.info(f"Selected {len(numeric_cols)} numeric columns for analysis: {var_names[:10]}...")
+        
+        # Remove rows with all NaN in data
+        valid_rows = ~np.all(np.isnan(data), axis=1)
+        data = data[valid_rows]
+        classes = classes[valid_rows]
+        
+    else:
+        # All columns are data, generate default classes
+        data = df.apply(pd.to_numeric, errors='coerce').values
+        
+        # Remove rows with all NaN
+        valid_rows = ~np.all(np.isnan(data), axis=1)
+        data = data[valid_rows]
+        
+        classes = np.full(data.shape[0], '1', dtype=object) if stable_labels else np.ones(data.shape[0], dtype=int)
+        var_names = list(df.columns)
+        logger.warning("No class column detected, using default class=1 for all samples")
+    
+    # Validate
+    if data.shape[0] < min_samples:
+        raise ValueError(f"Insufficient samples (minimum {min_samples} required)")
+    if data.shape[1] < 2:
+        raise ValueError("Insufficient variables (minimum 2 required)")
+    
+    logger.info(f"Parsed: {data.shape[0]} samples × {data.shape[1]} variables, {len(np.unique(classes))} classes")
+    
+    # var_names should already be set in either branch
+    return data, classes, var_names, '' if class_col_name is None else str(class_col_name)
+
+
 def _find_class_column(df: pd.DataFrame) -> tuple[int | None, str | None]:
     """
     Find the class/group column automatically
@@ -155,6 +286,21 @@ def _find_class_column(df: pd.DataFrame) -> tuple[int | None, str | None]:
     return None, None
 
 
+def _named_class_column(df: pd.DataFrame, name: str) -> tuple[int | None, str | None]:
+    """
+    Locate a class column by name ('' means the data has no class column)
+    
+    Returns:
+        (column_index, column_name) or (None, None)
+    """
+    if not name:
+        return None, None
+    for idx, col_name in enumerate(df.columns):
+        if str(col_name) == name:
+            return idx, col_name
+    raise ValueError(f"Class column '{name}' not found")
+
+
 def _is_class_column(series: pd.Series) -> bool:
     """Check if a column represents class labels"""
     try:
@@ -211,3 +357,23 @@ def _convert_to_class_labels(series: pd.Series) -> np.ndarray:
         logger.error(f"Failed to convert class labels: {e}")
         raise ValueError(f"Cannot convert class labels: {e}")
 
+
+def _stable_class_labels(series: pd.Series) -> np.ndarray:
+    """
+    Class labels as strings, consistent across files
+    
+    Numeric labels keep their integer value ("1", "2"); other labels keep
+    their text. Unlike _convert_to_class_labels, the result does not depend
+    on the set of labels present, so files uploaded in waves line up.
+    Each value is normalised on its own: a blank cell elsewhere in the column
+    (which makes pandas read it as float) must not turn 1 into "1.0".
+    """
+    missing = int(series.isna().sum())
+    if missing:
+        raise ValueError(f"Class column '{series.name}' has {missing} missing label(s)")
+    
+    numeric = pd.to_numeric(series, errors='coerce')
+    integral = np.isfinite(numeric) & (numeric % 1 == 0)
+    labels = series.astype(str)
+    labels[integral] = numeric[integral].astype(np.int64).astype(str)
+    return labels.values.astype(object)
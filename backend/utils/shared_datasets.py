@@ -0,0 +1,250 @@
+"""
+Shared Dataset Registry
+Cross-process, zero-copy sharing of parsed datasets via memory-mapped files
+
+Layout (one directory per dataset key under DATASET_SHM_DIR):
+- data.npy     float64 matrix (samples × variables)
+- classes.npy  int64 class labels
+- meta.json    variable names
+- refs.json    PIDs of live handles (one entry per handle)
+
+All workers map the same files read-only, so a dataset parsed once is
+available to every worker and analysis subprocess without copying.
+Parsing is serialized per key (see parse_lock), so identical uploads
+arriving together are parsed once.
+The directory is removed when the last handle is released. Entries whose
+holders all died (e.g. a killed worker) are pruned whenever a new dataset is
+published, and by prune_registry() at startup.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _default_root() -> Path:
+    """Prefer tmpfs (/dev/shm) so mapped pages never touch disk"""
+    if os.path.isdir('/dev/shm'):
+        return Path('/dev/shm') / 'kkh-datasets'
+    return Path(tempfile.gettempdir()) / 'kkh-datasets'
+
+
+REGISTRY_ROOT = Path(os.getenv('DATASET_SHM_DIR', str(_default_root())))
+PARSE_LOCK_STRIPES = 64  # bounded set of lock files shared by all keys
+
+
+def dataset_key(contents: bytes, filename: str = '', sheet_name: str | int = 0) -> str:
+    """Content hash identifying a dataset (extension and sheet included, as they drive parsing)"""
+    digest = hashlib.sha256()
+    digest.update(Path(filename).suffix.lower().encode())
+    digest.update(b'\0')
+    digest.update(repr(sheet_name).encode())
+    digest.update(b'\0')
+    digest.update(contents)
+    return digest.hexdigest()[:32]
+
+
+class SharedDataset:
+    """Handle to a registered dataset; read-only views over shared buffers"""
+
+    def __init__(self, key: str | None, data: np.ndarray, classes: np.ndarray, var_names: list[str]):
+        self.key = key  # None for a private (unregistered) handle
+        self.data = data
+        self.classes = classes
+        self.var_names = var_names
+        self._released = False
+
+    @classmethod
+    def private(cls, data: np.ndarray, classes: np.ndarray, var_names: list[str] | None) -> 'SharedDataset':
+        """Handle over process-local arrays, used when the registry is unavailable"""
+        return cls(None, data, classes, list(var_names) if var_names is not None else [])
+
+    def release(self) -> None:
+        """Drop this handle's reference (idempotent)"""
+        if self._released:
+            return
+        self._released = True
+        if self.key is not None:
+            _release(self.key)
+
+    def __enter__(self) -> 'SharedDataset':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+@contextmanager
+def _registry_lock():
+    """Exclusive lock serializing registry updates across processes"""
+    REGISTRY_ROOT.mkdir(parents=True, exist_ok=True)
+    with open(REGISTRY_ROOT / '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def parse_lock(key: str):
+    """
+    Exclusive lock held while a key is looked up, parsed and published
+
+    Keys are hashed onto a fixed set of lock files, so unrelated uploads
+    occasionally share a stripe but no per-key files accumulate. If the
+    registry directory is unusable, proceeds without locking.
+    """
+    stripe = int(key[:8], 16) % PARSE_LOCK_STRIPES
+    try:
+        REGISTRY_ROOT.mkdir(parents=True, exist_ok=True)
+        lock_file = open(REGISTRY_ROOT / f'.parse-{stripe:02d}.lock', 'a')
+    except OSError as e:
+        logger.warning(f"Parse lock unavailable, continuing unlocked: {e}")
+        yield
+        return
+
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_refs(entry: Path) -> list[int]:
+    try:
+        refs = json.loads((entry / 'refs.json').read_text())
+    except (FileNotFoundError, ValueError):
+        return []
+    return [pid for pid in refs if _pid_alive(pid)]
+
+
+def _write_refs(entry: Path, refs: list[int]) -> None:
+    tmp = entry / 'refs.json.tmp'
+    tmp.write_text(json.dumps(refs))
+    os.replace(tmp, entry / 'refs.json')
+
+
+def _open_views(key: str, entry: Path) -> SharedDataset:
+    data = np.load(entry / 'data.npy', mmap_mode='r')
+    classes = np.load(entry / 'classes.npy', mmap_mode='r')
+    var_names = json.loads((entry / 'meta.json').read_text())['var_names']
+    return SharedDataset(key, data, classes, var_names)
+
+
+def _attach_locked(key: str) -> SharedDataset | None:
+    entry = REGISTRY_ROOT / key
+    if not (entry / 'meta.json').exists():
+        return None
+
+    refs = _read_refs(entry)
+    refs.append(os.getpid())
+    _write_refs(entry, refs)
+    return _open_views(key, entry)
+
+
+def attach_dataset(key: str) -> SharedDataset | None:
+    """Attach to an already-registered dataset, or None if not registered"""
+    with _registry_lock():
+        handle = _attach_locked(key)
+    if handle is not None:
+        logger.info(f"Attached shared dataset {key}: {handle.data.shape[0]} × {handle.data.shape[1]}")
+    return handle
+
+
+def publish_dataset(
+    key: str,
+    data: np.ndarray,
+    classes: np.ndarray,
+    var_names: list[str] | None
+) -> SharedDataset:
+    """
+    Register a parsed dataset and return a handle to the shared copy
+
+    If another process registered the same key first, its buffers are
+    reused and the arrays passed in are discarded.
+    """
+    with _registry_lock():
+        handle = _attach_locked(key)
+        if handle is not None:
+            return handle
+
+        # Reclaim tmpfs held by dead workers before allocating more
+        _prune_locked()
+
+        entry = REGISTRY_ROOT / key
+        staging = Path(tempfile.mkdtemp(prefix=f'.{key}-', dir=REGISTRY_ROOT))
+        try:
+            np.save(staging / 'data.npy', np.ascontiguousarray(data, dtype=np.float64))
+            np.save(staging / 'classes.npy', np.ascontiguousarray(classes, dtype=np.int64))
+            names = [str(name) for name in var_names] if var_names is not None else []
+            (staging / 'meta.json').write_text(json.dumps({'var_names': names}))
+            _write_refs(staging, [os.getpid()])
+            shutil.rmtree(entry, ignore_errors=True)  # stale entry from a crashed worker
+            os.replace(staging, entry)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        logger.info(f"Published shared dataset {key}: {data.shape[0]} × {data.shape[1]}")
+        return _open_views(key, entry)
+
+
+def _release(key: str) -> None:
+    entry = REGISTRY_ROOT / key
+    with _registry_lock():
+        if not entry.exists():
+            return
+        refs = _read_refs(entry)
+        pid = os.getpid()
+        if pid in refs:
+            refs.remove(pid)
+        if refs:
+            _write_refs(entry, refs)
+            return
+        # Mapped views stay valid after unlink; pages are freed once unmapped
+        shutil.rmtree(entry, ignore_errors=True)
+    logger.info(f"Freed shared dataset {key}")
+
+
+def prune_registry() -> int:
+    """Remove datasets whose holders have all exited; returns number freed"""
+    if not REGISTRY_ROOT.exists():
+        return 0
+    with _registry_lock():
+        return _prune_locked()
+
+
+def _prune_locked() -> int:
+    freed = 0
+    for entry in REGISTRY_ROOT.iterdir():
+        if entry.name.startswith('.') or not entry.is_dir():
+            continue
+        refs = _read_refs(entry)
+        if refs:
+            _write_refs(entry, refs)
+        else:
+            shutil.rmtree(entry, ignore_errors=True)
+            logger.info(f"Pruned orphaned shared dataset {entry.name}")
+            freed += 1
+    return freed
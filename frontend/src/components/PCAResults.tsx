@@ -1,5 +1,5 @@
 import { Card } from "@/components/ui/card";
-import { ScatterChart, Scatter, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, BarChart, Bar, Legend, LineChart, Line } from "recharts";
+import { ScatterChart, Scatter, XAxis, YAxis, ZAxis, CartesianGrid, Tooltip, ResponsiveContainer, BarChart, Bar, Legend, LineChart, Line } from "recharts";
 import { useLanguage } from "@/hooks/useLanguage";
 
 export interface PCAScore {
@@ -10,10 +10,20 @@ export interface PCAScore {
   group: number;
 }
 
+export interface PCADensity {
+  pcX: number;
+  pcY: number;
+  xEdges: number[];
+  yEdges: number[];
+  groups: { group: number; counts: number[][] }[]; // counts[xBin][yBin]
+}
+
 export interface PCAResult {
   scores: PCAScore[];
   explainedVariance: number[];
   cumulativeVariance: number[];
+  density?: PCADensity[];
+  summary?: { aggregated?: boolean; n_samples?: number; n_points_returned?: number };
 }
 
 interface PCAResultsProps {
@@ -30,12 +40,35 @@ export const PCAResults = ({ results }: PCAResultsProps) => {
   }));
 
   const groupColors = ['#8b5cf6', '#3b82f6', '#10b981', '#f59e0b', '#ef4444'];
+  const scoreGroups = Array.from(new Set(results.scores.map(s => s.group)));
+
+  // Non-empty PC1/PC2 density bins per group, plotted at bin centres
+  const density = results.density?.find(d => d.pcX === 1 && d.pcY === 2);
+  const densityGroups = density ? density.groups.map(({ group, counts }) => ({
+    group,
+    cells: counts.flatMap((column, i) =>
+      column.flatMap((count, j) => count > 0 ? [{
+        pc1: (density.xEdges[i] + density.xEdges[i + 1]) / 2,
+        pc2: (density.yEdges[j] + density.yEdges[j + 1]) / 2,
+        count,
+      }] : [])
+    ),
+  })) : [];
+  const maxCount = Math.max(1, ...densityGroups.flatMap(g => g.cells.map(c => c.count)));
+  const sampled = results.summary?.aggregated && results.summary.n_samples !== results.summary.n_points_returned;
 
   return (
     <div className="space-y-6">
       {/* Scores Plot */}
       <Card className="p-6 backdrop-blur-sm bg-card/80 border-border">
         <h3 className="text-lg font-semibold mb-4 text-foreground">{t('pca.scoresPlot')}</h3>
+        {sampled && (
+          <p className="text-sm text-muted-foreground mb-2">
+            {t('pca.sampledPoints')
+              .replace('{shown}', String(results.summary?.n_points_returned))
+              .replace('{total}', String(results.summary?.n_samples))}
+          </p>
+        )}
         <ResponsiveContainer width="100%" height={400}>
           <ScatterChart margin={{ top: 20, right: 30, bottom: 20, left: 20 }}>
             <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
@@ -61,7 +94,7 @@ export const PCAResults = ({ results }: PCAResultsProps) => {
                 color: 'hsl(var(--foreground))'
               }}
             />
-            {Array.from(new Set(results.scores.map(s => s.group))).map((group, idx) => (
+            {scoreGroups.map((group, idx) => (
               <Scatter
                 key={group}
                 name={`Group ${group}`}
@@ -74,6 +107,56 @@ export const PCAResults = ({ results }: PCAResultsProps) => {
         </ResponsiveContainer>
       </Card>
 
+      {/* Score Density (all samples, binned) */}
+      {density && (
+        <Card className="p-6 backdrop-blur-sm bg-card/80 border-border">
+          <h3 className="text-lg font-semibold mb-4 text-foreground">{t('pca.densityPlot')}</h3>
+          <ResponsiveContainer width="100%" height={400}>
+            <ScatterChart margin={{ top: 20, right: 30, bottom: 20, left: 20 }}>
+              <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
+              <XAxis 
+                type="number" 
+                dataKey="pc1" 
+                name="PC1" 
+                domain={[density.xEdges[0], density.xEdges[density.xEdges.length - 1]]}
+                tickFormatter={(value: number) => value.toFixed(1)}
+                label={{ value: `PC1 (${results.explainedVariance[0]?.toFixed(1)}%)`, position: 'bottom', fill: 'hsl(var(--foreground))' }}
+                stroke="hsl(var(--foreground))"
+              />
+              <YAxis 
+                type="number" 
+                dataKey="pc2" 
+                name="PC2"
+                domain={[density.yEdges[0], density.yEdges[density.yEdges.length - 1]]}
+                tickFormatter={(value: number) => value.toFixed(1)}
+                label={{ value: `PC2 (${results.explainedVariance[1]?.toFixed(1)}%)`, angle: -90, position: 'left', fill: 'hsl(var(--foreground))' }}
+                stroke="hsl(var(--foreground))"
+              />
+              <ZAxis type="number" dataKey="count" name="Samples" domain={[0, maxCount]} range={[10, 300]} />
+              <Tooltip 
+                contentStyle={{ 
+                  backgroundColor: 'hsl(var(--card))', 
+                  border: '1px solid hsl(var(--border))',
+                  borderRadius: '8px',
+                  color: 'hsl(var(--foreground))'
+                }}
+              />
+              <Legend />
+              {densityGroups.map(({ group, cells }) => (
+                <Scatter
+                  key={group}
+                  name={`Group ${group}`}
+                  data={cells}
+                  fill={groupColors[Math.max(0, scoreGroups.indexOf(group)) % groupColors.length]}
+                  fillOpacity={0.5}
+                  shape="circle"
+                />
+              ))}
+            </ScatterChart>
+          </ResponsiveContainer>
+        </Card>
+      )}
+
       {/* Scree Plot */}
       <Card className="p-6 backdrop-blur-sm bg-card/80 border-border">
         <h3 className="text-lg font-semibold mb-4 text-foreground">{t('pca.screePlot')}</h3>
@@ -54,6 +54,8 @@ const translations = {
     'pca.screePlot': 'Scree Plot',
     'pca.varianceExplained': 'Explained Variance',
     'pca.cumulativeVariance': 'Cumulative Variance',
+    'pca.densityPlot': 'PCA Score Density',
+    'pca.sampledPoints': 'Showing {shown} of {total} samples',
     
     // Empty State
     'empty.title': 'Start by uploading data',
@@ -108,6 +110,8 @@ const translations = {
     'pca.screePlot': 'График каменистой осыпи',
     'pca.varianceExplained': 'Объясненная дисперсия',
     'pca.cumulativeVariance': 'Кумулятивная дисперсия',
+    'pca.densityPlot': 'Плотность счетов PCA',
+    'pca.sampledPoints': 'Показано {shown} из {total} образцов',
     
     // Empty State
     'empty.title': 'Начните с загрузки данных',
@@ -10,6 +10,14 @@ import { Download, BarChart3, Languages } from "lucide-react";
 import { useToast } from "@/hooks/use-toast";
 import { useLanguage } from "@/hooks/useLanguage";
 import { config } from "@/config";
+import { readNdjson } from "@/lib/utils";
+
+type AnovaStreamRecord =
+  | { type: 'summary'; summary: { benjamini_significant: number } }
+  | ({ type: 'result'; index: number } & AnovaResult)
+  | { type: 'boxplot'; index: number; variable: string; groups: BoxplotData[] }
+  | { type: 'end' }
+  | { type: 'error'; detail: string };
 
 const Index = () => {
   const { t, language, setLanguage } = useLanguage();
@@ -18,6 +26,7 @@ const Index = () => {
   const [analysisMethod, setAnalysisMethod] = useState<'anova' | 'pca'>('anova');
   const [results, setResults] = useState<AnovaResult[]>([]);
   const [boxplotData, setBoxplotData] = useState<BoxplotData[][]>([]);
+  const [boxplotVariables, setBoxplotVariables] = useState<string[]>([]);
   const [pcaResults, setPcaResults] = useState<PCAResult | null>(null);
   const { toast } = useToast();
 
@@ -25,6 +34,7 @@ const Index = () => {
     setSelectedFile(file);
     setResults([]);
     setBoxplotData([]);
+    setBoxplotVariables([]);
     setPcaResults(null);
   };
 
@@ -50,6 +60,7 @@ const Index = () => {
         formData.append('fdr_threshold', params.fdrThreshold.toString());
         formData.append('design_label', params.designLabel);
         formData.append('plot_option', params.plotOption.toString());
+        formData.append('stream', 'true');
         
         const response = await fetch(`${config.apiUrl}/api/analyze/anova`, {
           method: 'POST',
@@ -61,21 +72,57 @@ const Index = () => {
           throw new Error(error.detail || 'ANOVA analysis failed');
         }
         
-        const data = await response.json();
-        
-        setResults(data.results);
-        setBoxplotData(data.boxplot_data);
+        // Rows arrive most significant first; flush them in batches so the table renders early
+        setResults([]);
+        setBoxplotData([]);
+        setBoxplotVariables([]);
         setPcaResults(null);
         
+        let significantCount = 0;
+        let completed = false;
+        let pending: AnovaResult[] = [];
+        const flush = () => {
+          const batch = pending;
+          pending = [];
+          setResults(prev => prev.concat(batch));
+        };
+        
+        for await (const record of readNdjson<AnovaStreamRecord>(response)) {
+          if (record.type === 'summary') {
+            significantCount = record.summary.benjamini_significant;
+          } else if (record.type === 'result') {
+            pending.push(record);
+            if (pending.length >= 500) flush();
+          } else if (record.type === 'boxplot') {
+            setBoxplotData(prev => [...prev, record.groups]);
+            setBoxplotVariables(prev => [...prev, record.variable]);
+          } else if (record.type === 'error') {
+            throw new Error(record.detail);
+          } else {
+            completed = true;
+          }
+        }
+        flush();
+        
+        // A stream without its end record was cut off; the results are incomplete
+        if (!completed) {
+          throw new Error('ANOVA analysis ended unexpectedly');
+        }
+        
         toast({
           title: t('results.completed'),
-          description: t('results.foundSignificant').replace('{count}', String(data.summary.benjamini_significant)),
+          description: t('results.foundSignificant').replace('{count}', String(significantCount)),
         });
       } else {
         // Call PCA API
         formData.append('num_pcs', params.numPCs.toString());
         formData.append('scaling_method', params.scalingMethod);
         formData.append('design_label', params.designLabel);
+        // Large datasets: a capped sample of points plus binned densities of all scores
+        formData.append('aggregate', 'true');
+        formData.append('max_points', '2000');
+        formData.append('density_bins', '40');
+        formData.append('pc_pairs', '1-2');
         
         const response = await fetch(`${config.apiUrl}/api/analyze/pca`, {
           method: 'POST',
@@ -92,6 +139,7 @@ const Index = () => {
         setPcaResults(data);
         setResults([]);
         setBoxplotData([]);
+        setBoxplotVariables([]);
         
         toast({
           title: t('results.completed'),
@@ -99,6 +147,12 @@ const Index = () => {
         });
       }
     } catch (error) {
+      if (params.method === 'anova') {
+        // Don't leave a partial stream on screen as if it were the full result
+        setResults([]);
+        setBoxplotData([]);
+        setBoxplotVariables([]);
+      }
       toast({
         title: t('error.title'),
         description: error instanceof Error ? error.message : 'Analysis failed',
@@ -186,7 +240,7 @@ const Index = () => {
           </div>
         )}
 
-        {analysisMethod === 'anova' && results.length > 0 && !isAnalyzing && (
+        {analysisMethod === 'anova' && results.length > 0 && (
           <div className="space-y-6">
             <ResultsTable results={results} />
 
@@ -196,7 +250,7 @@ const Index = () => {
                 <InteractiveBoxplot
                   key={idx}
                   data={data}
-                  variable={results[idx]?.variable || `Variable ${idx + 1}`}
+                  variable={boxplotVariables[idx] || `Variable ${idx + 1}`}
                 />
               ))}
             </div>